@@ -0,0 +1,266 @@
+import io
+import logging
+import struct
+import threading
+import time
+import argparse
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional, Tuple
+from chat import ChatUser, ChatMessage  # generated automatically from chat.idl
+
+# Binary traffic log: a magic header followed by one record per received batch.
+#   record: kind (u8), arrival time ns (i64), sample count (u32), body size (u32), body
+#   body:   the samples, back to back
+#   sample: valid (bool), source timestamp ns (i64), then the data fields
+#   string: length (u16, 0xFFFF = None) + utf-8 bytes
+MAGIC = b"DDSCAP2\n"
+KIND_USERS_JOINED = 1
+KIND_USERS_DROPPED = 2
+KIND_MESSAGES = 3
+
+_REC = struct.Struct("<BqII")
+_INFO = struct.Struct("<?q")
+_U16 = struct.Struct("<H")
+_I64 = struct.Struct("<q")
+_NONE = 0xFFFF
+
+USER_FIELDS = ("username", "group", "firstName", "lastName")
+MSG_FIELDS = ("fromUser", "toUser", "toGroup", "message")
+
+def _pack_str(buf: List[bytes], s: Optional[str]):
+    if s is None:
+        buf.append(_U16.pack(_NONE))
+        return
+    b = s.encode("utf-8")
+    buf.append(_U16.pack(len(b)))
+    buf.append(b)
+
+def _unpack_str(data: bytes, pos: int) -> Tuple[Optional[str], int]:
+    (n,) = _U16.unpack_from(data, pos)
+    pos += _U16.size
+    if n == _NONE:
+        return None, pos
+    return data[pos:pos + n].decode("utf-8"), pos + n
+
+# Source timestamp of a sample in ns, or 0 when unavailable
+def _source_ts_ns(info) -> int:
+    try:
+        ts = info.source_timestamp
+        return ts.sec * 1_000_000_000 + ts.nanosec
+    except Exception:
+        return 0
+
+# Streams received samples to a binary log; safe to share between monitor threads.
+# A background thread flushes the buffer every FLUSH_INTERVAL_S, so a crash
+# loses at most about that much traffic, even after a burst followed by quiet.
+class CaptureWriter:
+    FLUSH_INTERVAL_S = 1.0
+
+    def __init__(self, path: str, buffer_size: int = 1 << 16, flush_interval_s: Optional[float] = None):
+        self._lock = threading.Lock()
+        self._file = open(path, "wb", buffering=buffer_size)
+        self._file.write(MAGIC)
+        self.flush_interval_s = self.FLUSH_INTERVAL_S if flush_interval_s is None else flush_interval_s
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    # Record one batch of DDS samples (data + info) as received
+    def write(self, kind: int, samples):
+        arrival_ns = time.time_ns()
+        buf: List[bytes] = []
+        count = 0
+        for s in samples:
+            count += 1
+            valid = bool(s.info.valid)
+            buf.append(_INFO.pack(valid, _source_ts_ns(s.info)))
+            data = s.data if valid else None
+            if kind == KIND_MESSAGES:
+                for f in MSG_FIELDS:
+                    _pack_str(buf, getattr(data, f, ""))
+                buf.append(_I64.pack(getattr(data, "timestamp_ms", 0)))
+            else:
+                for f in USER_FIELDS:
+                    _pack_str(buf, getattr(data, f, None))
+        if not count:
+            return
+        with self._lock:
+            if self._file.closed:
+                return
+            body = b"".join(buf)
+            self._file.write(_REC.pack(kind, arrival_ns, count, len(body)))
+            self._file.write(body)
+
+    def flush(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval_s):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self._flusher.join()
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+# One recorded sample with its sample info; data is None for invalid samples
+class CapturedSample(NamedTuple):
+    data: Any
+    valid: bool
+    source_ts_ns: int
+
+# One recorded batch: kind, arrival time and every sample as received
+class CaptureRecord:
+    def __init__(self, kind: int, arrival_ns: int, entries: List[CapturedSample]):
+        self.kind = kind
+        self.arrival_ns = arrival_ns
+        self.entries = entries
+
+    # Data of the valid samples, as the app's handlers receive it
+    @property
+    def samples(self) -> List:
+        return [e.data for e in self.entries if e.valid]
+
+def _parse_body(kind: int, count: int, body: bytes) -> List[CapturedSample]:
+    entries = []
+    pos = 0
+    for _ in range(count):
+        valid, source_ts_ns = _INFO.unpack_from(body, pos)
+        pos += _INFO.size
+        fields = {}
+        if kind == KIND_MESSAGES:
+            for f in MSG_FIELDS:
+                fields[f], pos = _unpack_str(body, pos)
+            (fields["timestamp_ms"],) = _I64.unpack_from(body, pos)
+            pos += _I64.size
+            sample = ChatMessage(**fields)
+        else:
+            for f in USER_FIELDS:
+                fields[f], pos = _unpack_str(body, pos)
+            sample = ChatUser(**fields)
+        entries.append(CapturedSample(sample if valid else None, valid, source_ts_ns))
+    return entries
+
+# Iterate the records of a capture log, one at a time.
+# A truncated last record (e.g. the process was killed) ends the log.
+def read_capture(path: str) -> Iterator[CaptureRecord]:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a capture log")
+        while True:
+            head = f.read(_REC.size)
+            if len(head) < _REC.size:
+                if head:
+                    logging.warning(f"{path}: ignoring truncated record at end of log")
+                return
+            kind, arrival_ns, count, size = _REC.unpack(head)
+            body = f.read(size)
+            if len(body) < size:
+                logging.warning(f"{path}: ignoring truncated record at end of log")
+                return
+            try:
+                entries = _parse_body(kind, count, body)
+            except (struct.error, UnicodeDecodeError):
+                logging.warning(f"{path}: stopping at corrupt record")
+                return
+            yield CaptureRecord(kind, arrival_ns, entries)
+
+# Feed a capture log into a dds_app.Handlers-like object.
+# speed: 1.0 = real time, N = N times faster, 0 = as fast as possible.
+# `tick` is called between records (e.g. to pump a GUI event loop).
+def replay(path: str, handlers, speed: float = 1.0, tick: Optional[Callable[[], None]] = None) -> int:
+    dispatch = {
+        KIND_USERS_JOINED: lambda s: handlers.users_joined(s),
+        KIND_USERS_DROPPED: lambda s: handlers.users_dropped(s),
+        KIND_MESSAGES: lambda s: handlers.message_received(s),
+    }
+    first_ns = None
+    start = time.perf_counter()
+    count = 0
+    for rec in read_capture(path):
+        if speed > 0:
+            if first_ns is None:
+                first_ns = rec.arrival_ns
+            due = start + (rec.arrival_ns - first_ns) / 1e9 / speed
+            while True:
+                left = due - time.perf_counter()
+                if left <= 0:
+                    break
+                if tick:
+                    tick()
+                time.sleep(min(left, 0.01))
+        samples = rec.samples
+        if samples:
+            dispatch[rec.kind](samples)
+        count += 1
+        if tick:
+            tick()
+    return count
+
+# Times every call to selected methods of an object
+class StageTimer:
+    def __init__(self):
+        self.stats = {}  # stage name -> [calls, total ns, max ns]
+
+    def wrap(self, obj, method: str, name: Optional[str] = None):
+        name = name or f"{type(obj).__name__}.{method}"
+        inner = getattr(obj, method)
+        stat = self.stats.setdefault(name, [0, 0, 0])
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter_ns()
+            try:
+                return inner(*args, **kwargs)
+            finally:
+                dt = time.perf_counter_ns() - t0
+                stat[0] += 1
+                stat[1] += dt
+                if dt > stat[2]:
+                    stat[2] = dt
+        setattr(obj, method, timed)
+
+    def report(self) -> str:
+        out = io.StringIO()
+        out.write(f"{'stage':<28}{'calls':>8}{'total ms':>12}{'mean us':>10}{'max us':>10}\n")
+        for name, (calls, total, peak) in self.stats.items():
+            mean = total / calls / 1000 if calls else 0
+            out.write(f"{name:<28}{calls:>8}{total / 1e6:>12.2f}{mean:>10.1f}{peak / 1000:>10.1f}\n")
+        return out.getvalue()
+
+# Replay a capture through MainApp/GuiApp and report per-stage timings
+def main():
+    parser = argparse.ArgumentParser(description="Replay a DDS chat traffic capture")
+    parser.add_argument("path", help="capture log written by DDSApp(capture=...)")
+    parser.add_argument("--speed", default="1",
+                        help="replay speed: 1 (real time), N (N times faster) or 'max'")
+    parser.add_argument("--user", default="replay", help="username the GUI shows as local user")
+    args = parser.parse_args()
+    speed = 0.0 if args.speed == "max" else float(args.speed)
+
+    import main as chat_main  # imported here: main -> dds_app -> capture
+    app = chat_main.MainApp(start=False)
+    app.dds_user = ChatUser(username=args.user, group="")
+    app.gui.state_joined = True
+    app.gui.widgets.user_entry.insert(0, args.user)
+
+    timer = StageTimer()
+    for method in ("joined", "left", "received"):
+        timer.wrap(app, method)
+    for method in ("user_joined", "user_left", "message_received"):
+        timer.wrap(app.gui, method)
+    # Handlers were bound before wrapping; point them at the timed stages
+    app.dds_handlers.users_joined = app.joined
+    app.dds_handlers.users_dropped = app.left
+    app.dds_handlers.message_received = app.received
+
+    t0 = time.perf_counter()
+    records = replay(args.path, app.dds_handlers, speed, tick=app.gui.root.update)
+    elapsed = time.perf_counter() - t0
+    print(f"Replayed {records} record(s) in {elapsed:.3f}s")
+    print(timer.report(), end="")
+    app.gui.root.destroy()
+
+if __name__ == "__main__":
+    main()
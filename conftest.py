@@ -0,0 +1,27 @@
+# Shared test setup; also lets tests import the top-level modules directly
+import sys
+import types
+import dataclasses
+
+# Without RTI Connext installed, stand in for the parts needed at import time,
+# so chat.py (and modules that import rti.connextdds) load. Nothing here talks DDS.
+def _stub_rti():
+    try:
+        import rti.connextdds  # noqa: F401
+        return
+    except ImportError:
+        pass
+    rti = types.ModuleType("rti")
+    idl = types.ModuleType("rti.idl")
+    idl.struct = lambda **_: dataclasses.dataclass
+    idl.__getattr__ = lambda name: (lambda *args, **kwargs: None)  # key, bound, ...
+    rpc = types.ModuleType("rti.rpc")
+    connextdds = types.ModuleType("rti.connextdds")
+    rti.idl, rti.rpc, rti.connextdds = idl, rpc, connextdds
+    sys.modules.update({"rti": rti, "rti.idl": idl, "rti.rpc": rpc, "rti.connextdds": connextdds})
+
+_stub_rti()
+
+# A chat message for tests; any object with ChatMessage's fields works with the code under test
+def msg(text, ts=0, from_user="a", to_user="", to_group="g"):
+    return types.SimpleNamespace(fromUser=from_user, toUser=to_user, toGroup=to_group, message=text, timestamp_ms=ts)
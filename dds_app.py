@@ -5,6 +5,8 @@ import time
 from typing import Callable, List, Optional, Iterable
 import rti.connextdds as dds
 from chat import ChatUser, ChatMessage  # generated automatically from chat.idl
+from history import HistoryStore, RetentionPolicy
+from capture import CaptureWriter, KIND_USERS_JOINED, KIND_USERS_DROPPED, KIND_MESSAGES
 
 # Callbacks for GUI
 class Handlers:
@@ -12,6 +14,62 @@ class Handlers:
     users_dropped: Callable[[List[ChatUser]], None] = lambda *_: logging.warning("Not implemented")
     message_received: Callable[[List[ChatMessage]], None] = lambda *_: logging.warning("Not implemented")
 
+# Filter stage: takes a batch of messages and returns the ones allowed through
+MessageFilter = Callable[[List[ChatMessage]], List[ChatMessage]]
+
+# ===== Helpers shared by DDSApp and the browser gateway =====
+
+# Participant with the given QoS profile, or default QoS if it can't be applied
+def create_participant(qos_provider, profile: str, domain_id: int):
+    try:
+        # Try to create participant with custom QoS
+        part_qos = qos_provider.participant_qos_from_profile(profile)
+        return dds.DomainParticipant(domain_id, part_qos)
+    except Exception:
+        # fallback: default QoS
+        return dds.DomainParticipant(domain_id)
+
+# Apply DDS partition change
+def set_partition(pubsub, partition_name: str):
+    qos = pubsub.qos
+    qos.partition.name = [partition_name]
+    pubsub.qos = qos
+
+# Presence samples not seen yet (joined or updated users)
+def select_new_users(reader):
+    state_new = dds.DataState(dds.SampleState.NOT_READ, dds.ViewState.ANY, dds.InstanceState.ALIVE)
+    return reader.select().state(state_new).read()
+
+# Presence samples of users that left or lost liveliness
+def select_dropped_users(reader):
+    return reader.select().state(dds.InstanceState.NOT_ALIVE_MASK).take()
+
+# New messages, taken out of the reader cache
+def take_new_messages(reader):
+    return reader.select().state(dds.DataState(dds.SampleState.NOT_READ, dds.ViewState.ANY, dds.InstanceState.ALIVE)).take()
+
+def valid_data(samples) -> List:
+    return [s.data for s in samples if s.info.valid]
+
+# Run messages through every filter stage
+def apply_filters(filters: List[MessageFilter], messages: List[ChatMessage]) -> List[ChatMessage]:
+    for stage in filters:
+        if not messages:
+            break
+        messages = stage(messages)
+    return messages
+
+# Chat message from `from_user` to a user, or to `group` when destination is the group
+def build_message(from_user: str, group: str, destination: str, text: str) -> ChatMessage:
+    is_group = (destination == group)
+    sample = ChatMessage()
+    sample.fromUser = from_user
+    sample.toUser  = "" if is_group else destination
+    sample.toGroup = destination if is_group else ""
+    sample.message = text
+    sample.timestamp_ms = int(time.time() * 1000)
+    return sample
+
 # DDS backend for the chat app: handles messaging, presence, and persistence.
 class DDSApp:
     TOPIC_NAME_USER = "userInfo"
@@ -22,23 +80,32 @@ class DDSApp:
     QOS_PROFILE_USER = "ChatUser_Profile"
     QOS_PROFILE_MSG = "ChatMessage_Persistent_Profile"
 
+    # Local history archive and how often expired history is rolled into it
+    ARCHIVE_DIR = os.path.join(os.path.dirname(__file__), "persistence", "archive")
+    COMPACT_INTERVAL_S = 60
+
     # Initialize DDS entities
     def __init__(self, user: ChatUser, handlers: Handlers = Handlers(),
-                 auto_join: bool = True, domain_id: int = 0):
+                 auto_join: bool = True, domain_id: int = 0,
+                 retention: Optional[RetentionPolicy] = None, capture: Optional[str] = None,
+                 message_filters: Optional[List[MessageFilter]] = None):
         self.user = user
         self.handlers = handlers
 
+        # Filter stages applied to outgoing and incoming messages, in order
+        self.message_filters: List[MessageFilter] = list(message_filters or [])
+
+        # Optional traffic capture of every received sample (see capture.py)
+        self.capture = CaptureWriter(capture) if capture else None
+
+        # Received messages are taken out of the reader cache and kept here,
+        # so the reader's resource limits are never reached
+        self.history = HistoryStore(retention, factory=ChatMessage)
+        self._last_compact = time.monotonic()
+
         # Load QoS from XML file
         self.qos_provider = dds.QosProvider(self.QOS_PROVIDER_XML)
-        try:
-            # Try to create participant with custom QoS
-            part_qos = self.qos_provider.participant_qos_from_profile(
-                f"{self.QOS_LIBRARY}::Chat_Profile"
-            )
-            self.participant = dds.DomainParticipant(domain_id, part_qos)
-        except Exception:
-            # fallback: default QoS
-            self.participant = dds.DomainParticipant(domain_id)
+        self.participant = create_participant(self.qos_provider, f"{self.QOS_LIBRARY}::Chat_Profile", domain_id)
 
         self.stop_condition = dds.GuardCondition()
 
@@ -64,8 +131,8 @@ class DDSApp:
         self.topic_msg = dds.Topic(self.participant, self.TOPIC_NAME_MSG, ChatMessage)
         self.pub_msg = dds.Publisher(self.participant)
         self.sub_msg = dds.Subscriber(self.participant)
-        self._set_partition(self.pub_msg, self.user.group)
-        self._set_partition(self.sub_msg, self.user.group)
+        set_partition(self.pub_msg, self.user.group)
+        set_partition(self.sub_msg, self.user.group)
 
         qos_profile_msg_str = f"{self.QOS_LIBRARY}::{self.QOS_PROFILE_MSG}"
         qos_writer = self.qos_provider.datawriter_qos_from_profile(qos_profile_msg_str)
@@ -107,8 +174,8 @@ class DDSApp:
 
     def user_update_group(self, group: str):
         self.user.group = group
-        self._set_partition(self.pub_msg, self.user.group)
-        self._set_partition(self.sub_msg, self.user.group)
+        set_partition(self.pub_msg, self.user.group)
+        set_partition(self.sub_msg, self.user.group)
         self.reader_cft.filter_parameters = [f"'{self.user.username}'", f"'{self.user.group}'"]
         self.writer_user.write(self.user)
     
@@ -117,60 +184,32 @@ class DDSApp:
         return self.reader_user.read_data()
     
     # ===== Messaging operations =====
-    def message_send(self, destination: str, message: str):
-        # Send a chat message (private or group)
-        is_group = (destination == self.user.group)
-        sample = ChatMessage()             
-        sample.fromUser = self.user.username
-        sample.toUser  = "" if is_group else destination
-        sample.toGroup = destination if is_group else ""
-        sample.message = message
-        sample.timestamp_ms = int(time.time() * 1000)
+    def message_send(self, destination: str, message: str) -> bool:
+        # Send a chat message (private or group); False if a filter dropped it
+        sample = build_message(self.user.username, self.user.group, destination, message)
+        if not apply_filters(self.message_filters, [sample]):
+            return False
         self.writer_msg.write(sample)
+        return True
 
-    # Retrieve all past messages (persistent)
+    # Retrieve all past messages: retained history plus this user's archive
     def message_history_all(self, limit: Optional[int] = None) -> List[ChatMessage]:
-        sel = self.reader_msg.select().state(dds.DataState(
-            dds.SampleState.ANY, dds.ViewState.ANY, dds.InstanceState.ANY
-        )).read()
-        samples = [s.data for s in sel if s.info.valid]
-        if limit is not None and len(samples) > limit:
-            samples = samples[-limit:]
-        return samples
+        return self.history.all(limit, archive_dir=self.ARCHIVE_DIR, prefix=self.user.username)
     
-    # Search stored messages for a keyword
+    # Search retained and archived messages for a keyword
     def message_history_search(self, keyword: str, limit: Optional[int] = None) -> List[ChatMessage]:
-        query_text = "(message LIKE %0) OR (fromUser LIKE %0) OR (toUser LIKE %0) OR (toGroup LIKE %0)"
-        param = [f"'%{keyword}%'"]
-
-        try:
-            query = dds.Query(self.reader_msg, query_text, param)
-            sel = (self.reader_msg
-                .select()
-                .state(dds.DataState(dds.SampleState.ANY, dds.ViewState.ANY, dds.InstanceState.ANY))
-                .content(query)
-                .read())
-            results = [s.data for s in sel if s.info.valid]
-        except Exception as e:
-            results = []
-
-        if not results:
-            all_sel = (self.reader_msg
-                    .select()
-                    .state(dds.DataState(dds.SampleState.ANY, dds.ViewState.ANY, dds.InstanceState.ANY))
-                    .read())
-            all_msgs = [s.data for s in all_sel if s.info.valid]
-            k = keyword.lower()
-            def hit(m: ChatMessage) -> bool:
-                return any(
-                    (getattr(m, f) or "").lower().find(k) >= 0
-                    for f in ("message", "fromUser", "toUser", "toGroup")
-                )
-            results = [m for m in all_msgs if hit(m)]
-
-        if limit is not None and len(results) > limit:
-            results = results[-limit:]
-        return results
+        return self.history.search(keyword, limit, archive_dir=self.ARCHIVE_DIR, prefix=self.user.username)
+
+    # Roll history expired by the retention policy into the archive
+    def history_compact(self) -> Optional[str]:
+        self._last_compact = time.monotonic()
+        return self.history.compact(self.ARCHIVE_DIR, prefix=self.user.username)
+
+    # Reload archived history (a segment file or a directory of them)
+    def history_import(self, path: Optional[str] = None) -> int:
+        if path is None:
+            return self.history.import_archive(self.ARCHIVE_DIR, prefix=self.user.username)
+        return self.history.import_archive(path)
     
     # ===== Shutdown =====
 
@@ -191,12 +230,8 @@ class DDSApp:
         self.waitset_msg.detach_all()
         self.participant.close_contained_entities()
         self.participant.close()
-
-    # Apply DDS partition change
-    def _set_partition(self, pubsub, partition_name: str):
-        qos = pubsub.qos
-        qos.partition.name = [partition_name]
-        pubsub.qos = qos
+        if self.capture:
+            self.capture.close()
 
     # Monitors user join and drop using WaitSet
     def _user_monitor(self):
@@ -206,15 +241,18 @@ class DDSApp:
                 if cond == self.stop_condition:
                     return
                 if cond == self.readcond_user:
-                    state_new = dds.DataState(dds.SampleState.NOT_READ, dds.ViewState.ANY, dds.InstanceState.ALIVE)
-                    new_samples = self.reader_user.select().state(state_new).read()
-                    joined_users = [s.data for s in new_samples if s.info.valid]
+                    new_samples = select_new_users(self.reader_user)
+                    if self.capture:
+                        self.capture.write(KIND_USERS_JOINED, new_samples)
+                    joined_users = valid_data(new_samples)
                     if joined_users:
                         self.handlers.users_joined(joined_users)
                     
                     # Users dropped
-                    dropped_samples = self.reader_user.select().state(dds.InstanceState.NOT_ALIVE_MASK).take()
-                    dropped_users = [s.data for s in dropped_samples if s.info.valid]
+                    dropped_samples = select_dropped_users(self.reader_user)
+                    if self.capture:
+                        self.capture.write(KIND_USERS_DROPPED, dropped_samples)
+                    dropped_users = valid_data(dropped_samples)
                     if dropped_users:
                         self.handlers.users_dropped(dropped_users)
 
@@ -225,7 +263,17 @@ class DDSApp:
                 if cond == self.stop_condition:
                     return
                 if cond == self.readcond_msg:
-                    samples = self.reader_msg.select().state(dds.DataState(dds.SampleState.NOT_READ, dds.ViewState.ANY, dds.InstanceState.ALIVE)).read()
-                    data = [s.data for s in samples if s.info.valid]
+                    samples = take_new_messages(self.reader_msg)
+                    if self.capture:
+                        self.capture.write(KIND_MESSAGES, samples)
+                    data = apply_filters(self.message_filters, valid_data(samples))
                     if data:
+                        self.history.add(data)
                         self.handlers.message_received(data)
+
+            # Periodic compaction job
+            if time.monotonic() - self._last_compact >= self.COMPACT_INTERVAL_S:
+                try:
+                    self.history_compact()
+                except Exception:
+                    logging.exception("history compaction failed")
@@ -0,0 +1,631 @@
+import os
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import argparse
+import bisect
+import threading
+from typing import Dict, List, Optional, Set
+from urllib.parse import urlsplit, parse_qs
+import rti.connextdds as dds
+from chat import ChatUser, ChatMessage, MAX_NAME_SIZE, MAX_MSG_SIZE  # generated automatically from chat.idl
+from dds_app import (DDSApp, MessageFilter, apply_filters, build_message, create_participant, set_partition,
+                     select_new_users, select_dropped_users, take_new_messages, valid_data)
+from history import HistoryStore, RetentionPolicy
+from moderation import ModerationFilter
+
+# ===== WebSocket framing (RFC 6455) =====
+WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_CONT, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+MAX_FRAME = 64 * 1024
+
+def ws_accept_key(key: str) -> str:
+    return base64.b64encode(hashlib.sha1(key.encode("ascii") + WS_GUID).digest()).decode("ascii")
+
+def _mask(payload: bytes, key: bytes) -> bytes:
+    if not payload:
+        return payload
+    n = len(payload)
+    k = (key * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(k, "big")).to_bytes(n, "big")
+
+# Encode one frame; servers send unmasked, clients must mask
+def ws_frame(opcode: int, payload: bytes, mask: bool = False) -> bytes:
+    n = len(payload)
+    head = bytearray([0x80 | opcode])
+    mbit = 0x80 if mask else 0
+    if n < 126:
+        head.append(mbit | n)
+    elif n < 1 << 16:
+        head.append(mbit | 126)
+        head += n.to_bytes(2, "big")
+    else:
+        head.append(mbit | 127)
+        head += n.to_bytes(8, "big")
+    if mask:
+        key = os.urandom(4)
+        return bytes(head) + key + _mask(payload, key)
+    return bytes(head) + payload
+
+# Read one complete message (joining continuation frames); returns (opcode, payload)
+async def ws_read(reader: asyncio.StreamReader, max_size: int = MAX_FRAME):
+    opcode = None
+    chunks = []
+    size = 0
+    while True:
+        b0, b1 = await reader.readexactly(2)
+        fin, op = b0 & 0x80, b0 & 0x0F
+        n = b1 & 0x7F
+        if n == 126:
+            n = int.from_bytes(await reader.readexactly(2), "big")
+        elif n == 127:
+            n = int.from_bytes(await reader.readexactly(8), "big")
+        key = await reader.readexactly(4) if b1 & 0x80 else None
+        size += n
+        if size > max_size:
+            raise ValueError("websocket message too large")
+        payload = await reader.readexactly(n)
+        if key:
+            payload = _mask(payload, key)
+        if op >= OP_CLOSE:
+            return op, payload  # control frames are never fragmented
+        if op != OP_CONT:
+            opcode = op
+        chunks.append(payload)
+        if fin:
+            return opcode, b"".join(chunks)
+
+# Page of time-ordered messages up to `before` (inclusive), oldest first, leaving
+# out the newest `skip` messages stamped exactly `before` (already served)
+def history_page(items: List, before: Optional[int] = None, limit: int = 50, skip: int = 0) -> List:
+    end = len(items)
+    if before is not None:
+        stamps = [m.timestamp_ms for m in items]
+        end = bisect.bisect_right(stamps, before)
+        end -= min(skip, end - bisect.bisect_left(stamps, before))
+    return items[max(0, end - limit):end]
+
+# ===== DDS side: one participant, one reader/writer pair per group =====
+class _Group:
+    def __init__(self, name, publisher, subscriber, writer, reader, readcond, history):
+        self.name = name
+        self.publisher = publisher
+        self.subscriber = subscriber
+        self.writer = writer
+        self.reader = reader
+        self.readcond = readcond
+        self.history = history
+        self.refs = 0  # connected sockets
+
+class DDSBus:
+    def __init__(self, domain_id: int = 0, retention: Optional[RetentionPolicy] = None,
+                 message_filters: Optional[List[MessageFilter]] = None):
+        self.retention = retention
+        self.gateway = None
+        self.loop = None
+        self.groups: Dict[str, _Group] = {}
+        self._lock = threading.Lock()
+        self._last_compact = time.monotonic()
+
+        # Filter stages applied to outgoing and incoming messages, in order
+        self.message_filters: List[MessageFilter] = list(message_filters or [])
+
+        self.qos_provider = dds.QosProvider(DDSApp.QOS_PROVIDER_XML)
+        self.participant = create_participant(self.qos_provider, f"{DDSApp.QOS_LIBRARY}::Chat_Profile", domain_id)
+
+        self.stop_condition = dds.GuardCondition()
+        self.waitset = dds.WaitSet()
+        self.waitset.attach_condition(self.stop_condition)
+
+        # ===== USER (presence), shared by every browser user =====
+        self.topic_user = dds.Topic(self.participant, DDSApp.TOPIC_NAME_USER, ChatUser)
+        profile_user = f"{DDSApp.QOS_LIBRARY}::{DDSApp.QOS_PROFILE_USER}"
+        self.writer_user = dds.DataWriter(self.topic_user, qos=self.qos_provider.datawriter_qos_from_profile(profile_user))
+        self.reader_user = dds.DataReader(self.topic_user, qos=self.qos_provider.datareader_qos_from_profile(profile_user))
+        self.readcond_user = dds.ReadCondition(
+            self.reader_user,
+            dds.DataState(dds.SampleState.NOT_READ, dds.ViewState.ANY, dds.InstanceState.ANY)
+        )
+        self.waitset.attach_condition(self.readcond_user)
+
+        # ===== MESSAGE (persistent), readers created per group on demand =====
+        self.topic_msg = dds.Topic(self.participant, DDSApp.TOPIC_NAME_MSG, ChatMessage)
+        self.profile_msg = f"{DDSApp.QOS_LIBRARY}::{DDSApp.QOS_PROFILE_MSG}"
+
+        self.thread = threading.Thread(target=self._monitor, daemon=True)
+
+    def attach(self, loop: asyncio.AbstractEventLoop, gateway: "Gateway"):
+        self.loop = loop
+        self.gateway = gateway
+        self.thread.start()
+
+    # Create the group's reader/writer the first time anyone joins it;
+    # every subscribe() is paired with an unsubscribe()
+    def subscribe(self, group: str) -> _Group:
+        with self._lock:
+            g = self.groups.get(group)
+            if g:
+                g.refs += 1
+                return g
+            pub = dds.Publisher(self.participant)
+            sub = dds.Subscriber(self.participant)
+            set_partition(pub, group)
+            set_partition(sub, group)
+            writer = dds.DataWriter(pub, self.topic_msg, qos=self.qos_provider.datawriter_qos_from_profile(self.profile_msg))
+            reader = dds.DataReader(sub, self.topic_msg, qos=self.qos_provider.datareader_qos_from_profile(self.profile_msg))
+            readcond = dds.ReadCondition(
+                reader,
+                dds.DataState(dds.SampleState.NOT_READ, dds.ViewState.ANY, dds.InstanceState.ALIVE)
+            )
+            g = _Group(group, pub, sub, writer, reader, readcond, HistoryStore(self.retention, factory=ChatMessage))
+            g.refs = 1
+            self.groups[group] = g
+            self.waitset.attach_condition(readcond)
+            return g
+
+    # Release the group's DDS entities when its last socket leaves
+    def unsubscribe(self, group: str):
+        with self._lock:
+            g = self.groups.get(group)
+            if not g:
+                return
+            g.refs -= 1
+            if g.refs > 0:
+                return
+            del self.groups[group]
+            self.waitset.detach_condition(g.readcond)
+            g.reader.close()
+            g.writer.close()
+            g.subscriber.close()
+            g.publisher.close()
+
+    # Send a message from `user` (who must be subscribed to their group); False if a filter dropped it
+    def message_send(self, user: ChatUser, destination: str, text: str) -> bool:
+        sample = build_message(user.username, user.group, destination, text)
+        if not apply_filters(self.message_filters, [sample]):
+            return False
+        with self._lock:
+            g = self.groups.get(user.group)
+            if not g:
+                raise ValueError(f"not subscribed to group {user.group}")
+            g.writer.write(sample)
+        return True
+
+    def user_join(self, user: ChatUser):
+        self.writer_user.write(user)
+
+    def user_leave(self, user: ChatUser):
+        handle = self.writer_user.lookup_instance(user)
+        if handle:
+            self.writer_user.unregister_instance(handle)
+
+    def user_list(self) -> List[ChatUser]:
+        return list(self.reader_user.read_data())
+
+    # Page of group history; see history_page()
+    def history(self, group: str, before: Optional[int] = None, limit: int = 50, skip: int = 0) -> List[ChatMessage]:
+        with self._lock:
+            g = self.groups.get(group)
+        if not g:
+            return []
+        return history_page(g.history.all(), before, limit, skip)
+
+    # Roll each group's expired history into the archive
+    def history_compact(self):
+        self._last_compact = time.monotonic()
+        with self._lock:
+            groups = list(self.groups.values())
+        for g in groups:
+            g.history.compact(DDSApp.ARCHIVE_DIR, prefix=f"gateway.{g.name}")
+
+    def close(self):
+        if self.participant.closed:
+            return
+        self.stop_condition.trigger_value = True
+        if self.thread.is_alive():
+            self.thread.join()
+        self.waitset.detach_all()
+        self.participant.close_contained_entities()
+        self.participant.close()
+
+    # Single WaitSet thread for presence and every group; hands data to the event loop
+    def _monitor(self):
+        while True:
+            active = self.waitset.wait(dds.Duration(1))
+            for cond in active:
+                if cond == self.stop_condition:
+                    return
+                if cond == self.readcond_user:
+                    joined = valid_data(select_new_users(self.reader_user))
+                    if joined:
+                        self.loop.call_soon_threadsafe(self.gateway.on_users, "joined", joined)
+                    dropped = valid_data(select_dropped_users(self.reader_user))
+                    if dropped:
+                        self.loop.call_soon_threadsafe(self.gateway.on_users, "dropped", dropped)
+                    continue
+                with self._lock:
+                    g = next((g for g in self.groups.values() if cond == g.readcond), None)
+                    # The group may have been released since the wait returned
+                    samples = take_new_messages(g.reader) if g else []
+                if g:
+                    data = apply_filters(self.message_filters, valid_data(samples))
+                    if data:
+                        # Only group messages are kept; private ones are just routed
+                        g.history.add([m for m in data if m.toGroup == g.name])
+                        self.loop.call_soon_threadsafe(self.gateway.on_messages, g.name, data)
+
+            # Periodic compaction job
+            if time.monotonic() - self._last_compact >= DDSApp.COMPACT_INTERVAL_S:
+                try:
+                    self.history_compact()
+                except Exception:
+                    logging.exception("history compaction failed")
+
+# ===== Gateway: WebSocket fan-out + HTTP history =====
+def message_json(m: ChatMessage) -> dict:
+    return {"fromUser": m.fromUser, "toUser": m.toUser, "toGroup": m.toGroup,
+            "message": m.message, "timestamp_ms": m.timestamp_ms}
+
+def user_json(u: ChatUser) -> dict:
+    return {"username": u.username, "group": u.group,
+            "firstName": u.firstName or "", "lastName": u.lastName or ""}
+
+# Strings are bounded in chat.idl (in UTF-8 bytes); DDS rejects longer ones on write
+def _too_long(s: str, bound: int) -> bool:
+    return len(s.encode("utf-8")) > bound
+
+# One connected browser socket
+class Connection:
+    def __init__(self, user: ChatUser, writer: asyncio.StreamWriter):
+        self.user = user
+        self.writer = writer
+        self.subscribed = False
+        self.closed = False
+
+# Fan-out timing: how long it took to hand each batch to every socket
+class FanoutStats:
+    def __init__(self):
+        self.batches = 0
+        self.frames = 0
+        self.sends = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, frames: int, sends: int, elapsed_ns: int):
+        self.batches += 1
+        self.frames += frames
+        self.sends += sends
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+
+    def as_dict(self) -> dict:
+        return {"batches": self.batches, "frames": self.frames, "sends": self.sends,
+                "mean_us": self.total_ns / self.batches / 1000 if self.batches else 0.0,
+                "max_us": self.max_ns / 1000}
+
+class Gateway:
+    MAX_HEADER = 16 * 1024
+    MAX_BUFFER = 1 << 20  # drop sockets whose unsent data exceeds this
+    HISTORY_PAGE = 50
+
+    def __init__(self, bus, host: str = "127.0.0.1", port: int = 8080):
+        self.bus = bus
+        self.host = host
+        self.port = port
+        self.by_group: Dict[str, Set[Connection]] = {}
+        self.by_user: Dict[str, Set[Connection]] = {}
+        self.stats = FanoutStats()
+        self.server = None
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(c) for c in self.by_group.values())
+
+    async def start(self):
+        self.bus.attach(asyncio.get_running_loop(), self)
+        # The StreamReader limit caps the request head read by readuntil()
+        self.server = await asyncio.start_server(self._handle, self.host, self.port, limit=self.MAX_HEADER)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for conns in list(self.by_group.values()):
+            for conn in list(conns):
+                self._drop(conn)
+        self.bus.close()
+
+    # ===== DDS to browsers (runs on the event loop) =====
+    def on_messages(self, group: str, messages: List[ChatMessage]):
+        t0 = time.perf_counter_ns()
+        conns = self.by_group.get(group, ())
+        frames = sends = 0
+        for m in messages:
+            frame = ws_frame(OP_TEXT, json.dumps({"type": "message", **message_json(m)}).encode("utf-8"))
+            frames += 1
+            if m.toUser:
+                # Private: the recipient and the sender's own sockets in this group
+                targets = {c for u in (m.toUser, m.fromUser) for c in self.by_user.get(u, ()) if c.user.group == group}
+            else:
+                targets = conns
+            for conn in list(targets):
+                self._send(conn, frame)
+                sends += 1
+        self.stats.record(frames, sends, time.perf_counter_ns() - t0)
+
+    def on_users(self, kind: str, users: List[ChatUser]):
+        t0 = time.perf_counter_ns()
+        frame = ws_frame(OP_TEXT, json.dumps({"type": kind, "users": [user_json(u) for u in users]}).encode("utf-8"))
+        sends = 0
+        for conns in list(self.by_group.values()):
+            for conn in list(conns):
+                self._send(conn, frame)
+                sends += 1
+        self.stats.record(1, sends, time.perf_counter_ns() - t0)
+
+    # The same frame bytes are written to every socket
+    def _send(self, conn: Connection, frame: bytes):
+        if conn.closed:
+            return
+        if conn.writer.transport.get_write_buffer_size() > self.MAX_BUFFER:
+            logging.warning(f"dropping slow client {conn.user.username}")
+            self._drop(conn)
+            return
+        conn.writer.write(frame)
+
+    # ===== HTTP / WebSocket handling =====
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError:
+            await self._respond(writer, 431, {"error": "request header too large"})
+            return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        try:
+            request_line, *header_lines = head.decode("latin-1").split("\r\n")
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            await self._respond(writer, 400, {"error": "bad request"})
+            return
+        headers = {}
+        for line in header_lines:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        url = urlsplit(target)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        if method != "GET":
+            await self._respond(writer, 405, {"error": "method not allowed"})
+        elif url.path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+            await self._websocket(reader, writer, headers, params)
+        elif url.path == "/history":
+            await self._history(writer, params)
+        elif url.path == "/users":
+            await self._respond(writer, 200, {"users": [user_json(u) for u in self.bus.user_list()]})
+        elif url.path == "/stats":
+            await self._respond(writer, 200, {
+                "connections": self.connection_count,
+                "groups": {g: len(c) for g, c in self.by_group.items()},
+                "fanout": self.stats.as_dict(),
+            })
+        else:
+            await self._respond(writer, 404, {"error": "not found"})
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, body: dict):
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                  431: "Request Header Fields Too Large"}.get(status, "")
+        data = json.dumps(body).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    # GET /history?group=g[&before=ts&skip=n][&limit=n]: group messages only.
+    # (next_before, next_skip) from one page is the cursor for the page before it.
+    async def _history(self, writer: asyncio.StreamWriter, params: Dict[str, str]):
+        group = params.get("group")
+        if not group:
+            await self._respond(writer, 400, {"error": "group is required"})
+            return
+        try:
+            before = int(params["before"]) if "before" in params else None
+            skip = max(0, int(params.get("skip", 0)))
+            limit = max(1, min(int(params.get("limit", self.HISTORY_PAGE)), 1000))
+        except ValueError:
+            await self._respond(writer, 400, {"error": "before, skip and limit must be integers"})
+            return
+        items = self.bus.history(group, before, limit, skip)
+        next_before = next_skip = None
+        if items:
+            # Messages sharing the oldest timestamp may continue on the next page
+            next_before = items[0].timestamp_ms
+            next_skip = sum(1 for m in items if m.timestamp_ms == next_before)
+            if next_before == before:
+                next_skip += skip
+        await self._respond(writer, 200, {
+            "messages": [message_json(m) for m in items],
+            "next_before": next_before,
+            "next_skip": next_skip,
+        })
+
+    # GET /ws?user=u&group=g[&firstName=..][&lastName=..]
+    async def _websocket(self, reader, writer, headers: Dict[str, str], params: Dict[str, str]):
+        key = headers.get("sec-websocket-key")
+        username, group = params.get("user"), params.get("group")
+        if not key or not username or not group:
+            await self._respond(writer, 400, {"error": "user, group and Sec-WebSocket-Key are required"})
+            return
+        if any(_too_long(params.get(n, ""), MAX_NAME_SIZE) for n in ("user", "group", "firstName", "lastName")):
+            await self._respond(writer, 400, {"error": f"names are limited to {MAX_NAME_SIZE} characters"})
+            return
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {ws_accept_key(key)}\r\n\r\n").encode("latin-1"))
+
+        user = ChatUser(username=username, group=group,
+                        firstName=params.get("firstName", ""), lastName=params.get("lastName", ""))
+        conn = Connection(user, writer)
+        try:
+            self.bus.subscribe(group)
+            conn.subscribed = True
+            first_for_user = not self.by_user.get(username)
+            self.by_group.setdefault(group, set()).add(conn)
+            self.by_user.setdefault(username, set()).add(conn)
+            if first_for_user:
+                self.bus.user_join(user)
+
+            while not conn.closed:
+                opcode, payload = await ws_read(reader)
+                if opcode == OP_CLOSE:
+                    writer.write(ws_frame(OP_CLOSE, payload[:2]))
+                    break
+                if opcode == OP_PING:
+                    writer.write(ws_frame(OP_PONG, payload))
+                elif opcode == OP_TEXT:
+                    self._client_message(conn, payload)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        except Exception:
+            logging.exception(f"websocket for {username} failed")
+        finally:
+            self._drop(conn)
+
+    # Browser -> DDS: {"to": "<user or group>", "message": "..."}
+    def _client_message(self, conn: Connection, payload: bytes):
+        try:
+            req = json.loads(payload)
+            destination, text = str(req["to"]), str(req["message"])
+        except (ValueError, KeyError, TypeError):
+            self._send(conn, ws_frame(OP_TEXT, b'{"type":"error","error":"bad message"}'))
+            return
+        if _too_long(destination, MAX_NAME_SIZE) or _too_long(text, MAX_MSG_SIZE):
+            self._send(conn, ws_frame(OP_TEXT, b'{"type":"error","error":"message too long"}'))
+            return
+        try:
+            sent = self.bus.message_send(conn.user, destination, text)
+        except Exception:
+            logging.exception(f"failed to send message from {conn.user.username}")
+            self._send(conn, ws_frame(OP_TEXT, b'{"type":"error","error":"send failed"}'))
+            return
+        if not sent:
+            self._send(conn, ws_frame(OP_TEXT, b'{"type":"error","error":"message blocked"}'))
+
+    def _drop(self, conn: Connection):
+        if conn.closed:
+            return
+        conn.closed = True
+        self.by_group.get(conn.user.group, set()).discard(conn)
+        peers = self.by_user.get(conn.user.username, set())
+        peers.discard(conn)
+        if not peers:
+            self.by_user.pop(conn.user.username, None)
+            try:
+                self.bus.user_leave(conn.user)
+            except Exception:
+                logging.exception(f"failed to unregister {conn.user.username}")
+        if not self.by_group.get(conn.user.group):
+            self.by_group.pop(conn.user.group, None)
+        if conn.subscribed:
+            try:
+                self.bus.unsubscribe(conn.user.group)
+            except Exception:
+                logging.exception(f"failed to release group {conn.user.group}")
+        conn.writer.close()
+
+# ===== Localhost load client: open N sockets and measure fan-out latency =====
+async def _bench_client(host, port, user, group):
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(os.urandom(16)).decode("ascii")
+    writer.write((f"GET /ws?user={user}&group={group} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+                  "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode("latin-1"))
+    head = await reader.readuntil(b"\r\n\r\n")
+    if not head.startswith(b"HTTP/1.1 101"):
+        raise ConnectionError(head.split(b"\r\n", 1)[0].decode("latin-1"))
+    return reader, writer
+
+async def bench(host: str, port: int, clients: int, messages: int, group: str = "bench"):
+    conns = await asyncio.gather(*(_bench_client(host, port, f"bench{i}", group) for i in range(clients)))
+    latencies: List[float] = []
+    done = asyncio.Event()
+    expected = clients * messages
+
+    async def receive(reader):
+        while True:
+            opcode, payload = await ws_read(reader, max_size=1 << 20)
+            if opcode != OP_TEXT:
+                continue
+            msg = json.loads(payload)
+            if msg.get("type") == "message" and msg["message"].startswith("bench "):
+                latencies.append((time.time_ns() - int(msg["message"][6:])) / 1e6)
+                if len(latencies) >= expected:
+                    done.set()
+
+    tasks = [asyncio.ensure_future(receive(r)) for r, _ in conns]
+    _, sender = conns[0]
+    for _ in range(messages):
+        body = json.dumps({"to": group, "message": f"bench {time.time_ns()}"}).encode("utf-8")
+        sender.write(ws_frame(OP_TEXT, body, mask=True))
+        await sender.drain()
+    try:
+        await asyncio.wait_for(done.wait(), timeout=30)
+    except asyncio.TimeoutError:
+        pass
+    for t in tasks:
+        t.cancel()
+    for _, w in conns:
+        w.close()
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else float("nan")
+    print(f"clients={clients} delivered={len(latencies)}/{expected} "
+          f"p50={pct(0.5):.2f}ms p99={pct(0.99):.2f}ms max={pct(1.0):.2f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket/HTTP gateway for browser chat clients")
+    sub = parser.add_subparsers(dest="cmd")
+    p_serve = sub.add_parser("serve", help="run the gateway (default)")
+    p_bench = sub.add_parser("bench", help="load-test a running gateway from localhost")
+    for p in (p_serve, p_bench):
+        p.add_argument("--host", default="127.0.0.1")
+        p.add_argument("--port", type=int, default=8080)
+    p_serve.add_argument("--domain", type=int, default=0)
+    p_bench.add_argument("--clients", type=int, default=100)
+    p_bench.add_argument("--messages", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.cmd == "bench":
+        asyncio.run(bench(args.host, args.port, args.clients, args.messages))
+        return
+
+    host = getattr(args, "host", "127.0.0.1")
+    port = getattr(args, "port", 8080)
+    domain = getattr(args, "domain", 0)
+    # Same moderation rules as the desktop client (see moderation.py)
+    rules = os.environ.get("CHAT_MODERATION_RULES")
+    filters = [ModerationFilter(rules)] if rules else []
+    gateway = Gateway(DDSBus(domain, message_filters=filters), host, port)
+    try:
+        asyncio.run(gateway.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gateway.bus.close()
+
+if __name__ == "__main__":
+    main()
@@ -55,6 +55,10 @@ class GuiApp:
         prefix = f"[{ts}] " if ts else ""
         self.widgets.message_text.append_line(f"{prefix}{user} (to {dest_str}): {message}")
 
+    # Display a status line from the backend
+    def notice(self, text):
+        self.widgets.message_text.append_line(f"> {text}")
+
     # Display results of message search
     def history_results(self, items):
         if not items:
@@ -0,0 +1,252 @@
+import os
+import re
+import gzip
+import json
+import heapq
+import threading
+import time
+from collections import Counter
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+# Columns written to the archive, in ChatMessage field order
+ARCHIVE_COLUMNS = ("fromUser", "toUser", "toGroup", "message", "timestamp_ms")
+ARCHIVE_SUFFIX = ".jsonl.gz"
+# Segment names: <prefix>-<first timestamp>-<last timestamp>-<count>.jsonl.gz
+_SEGMENT_RE = re.compile(r"^(?P<prefix>.+)-(?P<first>\d+)-(?P<last>\d+)-(?P<count>\d+)\.jsonl\.gz$")
+
+# Identity of a message, used to drop duplicates across segments
+def message_key(m) -> tuple:
+    return tuple(getattr(m, c) or "" for c in ARCHIVE_COLUMNS[:-1]) + (m.timestamp_ms,)
+
+# Segment paths in archive_dir, oldest first; only `prefix`'s when given,
+# and only those overlapping [since, until] (inclusive) when given
+def list_segments(archive_dir: str, prefix: Optional[str] = None,
+                  since: Optional[int] = None, until: Optional[int] = None) -> List[str]:
+    if not os.path.isdir(archive_dir):
+        return []
+    found = []
+    for name in os.listdir(archive_dir):
+        m = _SEGMENT_RE.match(name)
+        if not m or (prefix is not None and m.group("prefix") != prefix):
+            continue
+        first, last = int(m.group("first")), int(m.group("last"))
+        if (since is not None and last < since) or (until is not None and first > until):
+            continue
+        found.append((first, name))
+    return [os.path.join(archive_dir, name) for _, name in sorted(found)]
+
+# Keys of the messages archived for `prefix` between since and until (inclusive)
+def archived_keys(archive_dir: str, prefix: str, since: int, until: int) -> Set[tuple]:
+    keys = set()
+    for p in list_segments(archive_dir, prefix, since, until):
+        keys.update(message_key(m) for m in read_segment(p, _Row) if since <= m.timestamp_ms <= until)
+    return keys
+
+# Conversation a message belongs to: the group, or the (sorted) pair of users
+def conversation_key(m) -> str:
+    if m.toGroup:
+        return f"#{m.toGroup}"
+    a, b = sorted((m.fromUser, m.toUser))
+    return f"@{a}|{b}"
+
+# How much history a client keeps before compaction rolls it into the archive.
+# Any limit left as None is not enforced.
+class RetentionPolicy:
+    def __init__(self, max_age_s: Optional[float] = 7 * 24 * 3600,
+                 max_count: Optional[int] = 5000,
+                 max_per_conversation: Optional[int] = 1000):
+        self.max_age_s = max_age_s
+        self.max_count = max_count
+        self.max_per_conversation = max_per_conversation
+
+    # Split time-ordered messages into (kept, expired)
+    def split(self, messages: List, now_ms: Optional[int] = None) -> Tuple[List, List]:
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        expired = [False] * len(messages)
+
+        if self.max_age_s is not None:
+            cutoff = now_ms - int(self.max_age_s * 1000)
+            for i, m in enumerate(messages):
+                if m.timestamp_ms >= cutoff:
+                    break
+                expired[i] = True
+
+        # Newest messages win: walk backwards and expire past each quota
+        if self.max_per_conversation is not None:
+            seen = Counter()
+            for i in range(len(messages) - 1, -1, -1):
+                if expired[i]:
+                    continue
+                key = conversation_key(messages[i])
+                seen[key] += 1
+                if seen[key] > self.max_per_conversation:
+                    expired[i] = True
+
+        if self.max_count is not None:
+            left = self.max_count
+            for i in range(len(messages) - 1, -1, -1):
+                if expired[i]:
+                    continue
+                if left > 0:
+                    left -= 1
+                else:
+                    expired[i] = True
+
+        kept = [m for m, e in zip(messages, expired) if not e]
+        gone = [m for m, e in zip(messages, expired) if e]
+        return kept, gone
+
+# Plain row type for reading segments without a message factory
+class _Row:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+# Write messages as a gzip'd segment of columnar JSON batches (one batch per line)
+def write_segment(path: str, messages: List, batch_size: int = 4096):
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+        for start in range(0, len(messages), batch_size):
+            batch = messages[start:start + batch_size]
+            cols = {c: [getattr(m, c) or "" for m in batch] for c in ARCHIVE_COLUMNS[:-1]}
+            cols["timestamp_ms"] = [m.timestamp_ms for m in batch]
+            f.write(json.dumps(cols, ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+    os.replace(tmp, path)
+
+# Read a segment back, building one message per row with `factory`
+def read_segment(path: str, factory: Callable) -> List:
+    out = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            cols = json.loads(line)
+            rows = zip(*(cols[c] for c in ARCHIVE_COLUMNS))
+            out.extend(factory(**dict(zip(ARCHIVE_COLUMNS, row))) for row in rows)
+    return out
+
+# Client-side message history with retention, compaction and archive import
+class HistoryStore:
+    def __init__(self, policy: RetentionPolicy = None, factory: Callable = None):
+        self.policy = policy or RetentionPolicy()
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._live: List = []      # received messages, subject to retention
+        self._restored: List = []  # imported from the archive, never re-compacted
+
+    def __len__(self):
+        with self._lock:
+            return len(self._live) + len(self._restored)
+
+    def add(self, messages: Iterable):
+        messages = list(messages)
+        if not messages:
+            return
+        with self._lock:
+            # Samples normally arrive in order, so only sort when they don't
+            last = self._live[-1].timestamp_ms if self._live else None
+            self._live.extend(messages)
+            if (last is not None and messages[0].timestamp_ms < last) or \
+                    any(a.timestamp_ms > b.timestamp_ms for a, b in zip(messages, messages[1:])):
+                self._live.sort(key=lambda m: m.timestamp_ms)
+
+    # All messages, oldest first. With archive_dir, messages archived under
+    # `prefix` that were not imported are included too.
+    def all(self, limit: Optional[int] = None, archive_dir: Optional[str] = None,
+            prefix: Optional[str] = None) -> List:
+        with self._lock:
+            if not self._restored:
+                items = list(self._live)
+            else:
+                items = list(heapq.merge(self._restored, self._live, key=lambda m: m.timestamp_ms))
+        if archive_dir is not None:
+            items = self._merge_archive(items, archive_dir, prefix)
+        if limit is not None and len(items) > limit:
+            items = items[-limit:]
+        return items
+
+    # Case-insensitive substring match on any text field (archive_dir/prefix as in all())
+    def search(self, keyword: str, limit: Optional[int] = None, archive_dir: Optional[str] = None,
+               prefix: Optional[str] = None) -> List:
+        k = keyword.lower()
+        def hit(m) -> bool:
+            return any(
+                (getattr(m, f) or "").lower().find(k) >= 0
+                for f in ("message", "fromUser", "toUser", "toGroup")
+            )
+        results = [m for m in self.all(archive_dir=archive_dir, prefix=prefix) if hit(m)]
+        if limit is not None and len(results) > limit:
+            results = results[-limit:]
+        return results
+
+    # Merge archived messages into time-ordered `items`, skipping ones already there
+    def _merge_archive(self, items: List, archive_dir: str, prefix: Optional[str]) -> List:
+        if self.factory is None:
+            raise ValueError("HistoryStore needs a message factory to read archives")
+        seen = {message_key(m) for m in items}
+        archived = []
+        for p in list_segments(archive_dir, prefix):
+            for m in read_segment(p, self.factory):
+                key = message_key(m)
+                if key not in seen:
+                    seen.add(key)
+                    archived.append(m)
+        if not archived:
+            return items
+        archived.sort(key=lambda m: m.timestamp_ms)
+        return list(heapq.merge(archived, items, key=lambda m: m.timestamp_ms))
+
+    # Apply the retention policy and roll expired messages into an archive segment.
+    # Messages already in an overlapping segment (e.g. replayed again by the
+    # Persistence Service after a restart) are not archived twice.
+    # Returns the segment path, or None when nothing new expired.
+    def compact(self, archive_dir: str, prefix: str = "chat", now_ms: Optional[int] = None) -> Optional[str]:
+        with self._lock:
+            kept, expired = self.policy.split(self._live, now_ms)
+            if not expired:
+                return None
+            self._live = kept
+
+        expired.sort(key=lambda m: m.timestamp_ms)
+        try:
+            seen = archived_keys(archive_dir, prefix, expired[0].timestamp_ms, expired[-1].timestamp_ms)
+            fresh = [m for m in expired if message_key(m) not in seen]
+            if not fresh:
+                return None
+            os.makedirs(archive_dir, exist_ok=True)
+            name = f"{prefix}-{fresh[0].timestamp_ms}-{fresh[-1].timestamp_ms}-{len(fresh)}{ARCHIVE_SUFFIX}"
+            path = os.path.join(archive_dir, name)
+            write_segment(path, fresh)
+        except Exception:
+            # Don't lose history if the archive can't be read or written
+            self.add(expired)
+            raise
+        return path
+
+    # Bulk-load archive segments (a file, or every segment in a directory,
+    # only `prefix`'s when given). Messages already loaded are skipped.
+    # Returns the number of messages loaded.
+    def import_archive(self, path: str, prefix: Optional[str] = None) -> int:
+        if self.factory is None:
+            raise ValueError("HistoryStore needs a message factory to import archives")
+        if os.path.isdir(path):
+            paths = list_segments(path, prefix)
+        else:
+            paths = [path]
+
+        with self._lock:
+            seen = {message_key(m) for m in self._restored}
+        loaded = []
+        for p in paths:
+            for m in read_segment(p, self.factory):
+                key = message_key(m)
+                if key not in seen:
+                    seen.add(key)
+                    loaded.append(m)
+        loaded.sort(key=lambda m: m.timestamp_ms)
+
+        with self._lock:
+            self._restored = list(heapq.merge(self._restored, loaded, key=lambda m: m.timestamp_ms))
+        return len(loaded)
+
+    def clear_restored(self):
+        with self._lock:
+            self._restored = []
@@ -1,11 +1,13 @@
+import os
 import gui
 import dds_app
+from moderation import ModerationFilter
 from chat import ChatUser
 
 # Bridges GUI and DDS app
 class MainApp:
 
-    def __init__(self):
+    def __init__(self, start: bool = True):
         # Connect GUI event handlers
         self.gui_handlers = gui.Handlers()
         self.gui_handlers.join           = self.join
@@ -26,15 +28,22 @@ class MainApp:
         self.dds_handlers.message_received= self.received
         self.dds_app = None
 
-        self.gui.start() # Start GUI loop
-        self.leave() # Clean DDS participant after GUI closes
+        if start:
+            self.gui.start() # Start GUI loop
+            self.leave() # Clean DDS participant after GUI closes
 
     # ===== GUI to DDS =====
     # Called when user presses Join
     def join(self, user, group, name, last_name):
         self.dds_user = ChatUser(username=user, group=group,
                                  firstName=(name or ""), lastName=(last_name or ""))
-        self.dds_app = dds_app.DDSApp(self.dds_user, self.dds_handlers)
+        # Set CHAT_CAPTURE to a file path to record received traffic (see capture.py)
+        # Set CHAT_MODERATION_RULES to a rule file to filter messages (see moderation.py)
+        rules = os.environ.get("CHAT_MODERATION_RULES")
+        filters = [ModerationFilter(rules)] if rules else []
+        self.dds_app = dds_app.DDSApp(self.dds_user, self.dds_handlers,
+                                      capture=os.environ.get("CHAT_CAPTURE"),
+                                      message_filters=filters)
 
     # Called when user clicks 'Update'
     def update_user(self, group):
@@ -55,7 +64,8 @@ class MainApp:
     # Send message via DDS
     def send(self, destination, message):
         if not self.dds_app: return
-        self.dds_app.message_send(destination=destination, message=message)
+        if not self.dds_app.message_send(destination=destination, message=message):
+            self.gui.notice("Message blocked by moderation.")
 
     # Search message history via DDS
     def search_history(self, keyword: str):
@@ -0,0 +1,327 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+try:
+    import re._parser as _sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse as _sre_parse
+
+# Rule file format, one rule per line ('#' starts a comment):
+#   block <term>         whole-word, case-insensitive term
+#   flag  <term>
+#   block re:<regex>     case-insensitive regex (e.g. link patterns)
+#   flag  re:https?://\S+
+# A line without an action is a 'block' rule. Block rules always win over
+# flag rules. Regex rules may start with inline flags such as (?s), but may
+# not use numbered backreferences (\1), because rules without a literal
+# part share one pattern.
+ACTIONS = ("block", "flag")
+ALLOW = "allow"
+
+# Build a regex that matches any of `words` by walking a trie, so the regex
+# engine never re-scans a shared prefix (no backtracking over alternatives).
+def _trie_regex(words: List[str]) -> str:
+    trie: Dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def emit(node: Dict) -> str:
+        end = "" in node
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        if len(branches) == 1:
+            body = branches[0]
+            return f"(?:{body})?" if end else body
+        body = "(?:" + "|".join(branches) + ")"
+        return body + "?" if end else body
+
+    return emit(trie)
+
+# Outcome of checking one message
+class ModerationResult:
+    def __init__(self, action: str = ALLOW, rule: Optional[str] = None, cost_ns: int = 0):
+        self.action = action
+        self.rule = rule
+        self.cost_ns = cost_ns
+
+    @property
+    def blocked(self) -> bool:
+        return self.action == "block"
+
+_GLOBAL_FLAGS_RE = re.compile(r"^\(\?([aiLmsux]+)\)")
+_NUMBERED_BACKREF_RE = re.compile(r"(?<!\\)(?:\\\\)*\\[1-9]")
+
+# Make a regex rule safe to embed in a combined pattern: leading global
+# flags become scoped flags, numbered backreferences are rejected.
+def _prepare_regex(pattern: str) -> str:
+    m = _GLOBAL_FLAGS_RE.match(pattern)
+    if m:
+        pattern = f"(?{m.group(1)}:{pattern[m.end():]})"
+    if _NUMBERED_BACKREF_RE.search(pattern):
+        raise ValueError("numbered backreferences are not supported")
+    re.compile(pattern)
+    return pattern
+
+# One combined regex for many rules; which rule matched is found from the group name
+def _combine(patterns: List[Tuple[str, str]]) -> "re.Pattern":
+    alts = lambda items: "|".join(f"(?P<r{i}>{p})" for i, (p, _) in enumerate(items))
+    try:
+        return re.compile(alts(patterns), re.IGNORECASE)
+    except re.error:
+        # Find the first rule that breaks the combination
+        for i in range(len(patterns)):
+            try:
+                re.compile(alts(patterns[:i + 1]), re.IGNORECASE)
+            except re.error as e:
+                raise ValueError(f"rule {patterns[i][1]!r} conflicts with earlier rules: {e}") from None
+        raise
+
+_REPEATS = {_sre_parse.MAX_REPEAT, _sre_parse.MIN_REPEAT, getattr(_sre_parse, "POSSESSIVE_REPEAT", None)}
+# Characters that IGNORECASE matches against ASCII letters but str.lower() doesn't map to them
+_FOLD = str.maketrans({"\u0130": "i", "\u0131": "i", "\u017f": "s", "\u212a": "k"})
+
+# Literals (lowercased, ASCII) that every match of `pattern` must contain
+def _required_literals(pattern: str) -> List[str]:
+    runs = [[]]
+
+    def walk(items):
+        for op, av in items:
+            if op is _sre_parse.LITERAL and av < 128:
+                runs[-1].append(chr(av).lower())
+            elif op is _sre_parse.SUBPATTERN:
+                walk(av[-1])  # a group is part of the surrounding sequence
+            elif op is _sre_parse.AT:
+                continue      # anchors are zero-width
+            elif op in _REPEATS and av[0] >= 1:
+                runs.append([])
+                walk(av[2])
+                runs.append([])
+            else:
+                runs.append([])
+
+    walk(_sre_parse.parse(pattern))
+    return list(dict.fromkeys(lit for lit in ("".join(r) for r in runs) if lit))
+
+# Regex rules found through their required literals, so only rules whose
+# literal shows up in the text are run. Each rule is keyed on its most
+# specific literal (shared by the fewest rules, then longest); all keys are
+# found in one trie scan. A rule that also needs punctuation (e.g. "://")
+# is gated on it, so its keys are only scanned for when the text has it.
+class _LiteralIndex:
+    def __init__(self, regexes: List[Tuple[str, str, str]]):
+        self.rules: List[Tuple[str, "re.Pattern", str]] = []  # (action, regex, rule text)
+        self.unindexed: List[Tuple[str, str, str]] = []       # rules without a literal
+        literals = []
+        for action, prepared, rule in regexes:
+            lits = _required_literals(prepared)
+            if lits:
+                literals.append(lits)
+                self.rules.append((action, re.compile(prepared, re.IGNORECASE), rule))
+            else:
+                self.unindexed.append((action, prepared, rule))
+
+        shared = Counter(lit for lits in literals for lit in lits)
+        groups: Dict[str, Dict[str, List[int]]] = {}  # gate -> key -> rule indices
+        for i, lits in enumerate(literals):
+            key = min(lits, key=lambda lit: (shared[lit], -len(lit)))
+            gates = [lit for lit in lits if lit != key and not lit.isalnum()]
+            gate = max(gates, key=len) if gates else ""
+            groups.setdefault(gate, {}).setdefault(key, []).append(i)
+
+        # The trie reports the longest key at a position; keys that are
+        # prefixes of it are present too
+        self.groups = []
+        for gate, by_key in groups.items():
+            implied = {key: sorted(i for other, ids in by_key.items() if key.startswith(other) for i in ids)
+                       for key in by_key}
+            self.groups.append((gate, re.compile(_trie_regex(list(by_key))), implied))
+
+    # Rules whose key (and gate) appear in `text`, in rule order
+    def candidates(self, text: str, lowered: str) -> List[Tuple[str, "re.Pattern", str]]:
+        if not self.groups:
+            return []
+        folded = lowered if text.isascii() else text.translate(_FOLD).lower()
+        found = set()
+        for gate, key_re, implied in self.groups:
+            if gate and gate not in folded:
+                continue
+            pos = 0
+            while True:
+                m = key_re.search(folded, pos)
+                if m is None:
+                    break
+                found.update(implied[m.group(0)])
+                pos = m.start() + 1
+        return [self.rules[i] for i in sorted(found)]
+
+# Matchers for the rules of one action: a term trie, the regex rules the
+# literal index found, and one combined regex for rules without a literal
+class _Matcher:
+    def __init__(self, action: str, terms: List[str], unindexed: List[Tuple[str, str]]):
+        self.action = action
+        self.term_re = None
+        if terms:
+            self.term_re = re.compile(r"(?<!\w)(?:" + _trie_regex(terms) + r")(?!\w)")
+        self.unindexed = unindexed  # (prepared pattern, rule text)
+        self.unindexed_re = _combine(unindexed) if unindexed else None
+
+    # First rule found in text, or None
+    def search(self, text: str, lowered: str, candidates: List[Tuple[str, "re.Pattern", str]]) -> Optional[str]:
+        if self.term_re is not None:
+            m = self.term_re.search(lowered)
+            if m:
+                return m.group(0)
+        for action, pattern, rule in candidates:
+            if action == self.action and pattern.search(text):
+                return rule
+        if self.unindexed_re is not None:
+            m = self.unindexed_re.search(text)
+            if m:
+                return self.unindexed[int(m.lastgroup[1:])][1]
+        return None
+
+# Precompiled rule set; immutable once built.
+# Block and flag rules are matched separately, block first, so a broad flag
+# rule can never hide a block rule that matches inside the same text.
+# One literal index covers the regex rules of both actions.
+class _RuleSet:
+    def __init__(self, rules: List[Tuple[str, str]]):
+        term_action: Dict[str, str] = {}
+        regexes: List[Tuple[str, str, str]] = []
+        for action, pattern in rules:
+            if pattern.startswith("re:"):
+                try:
+                    prepared = _prepare_regex(pattern[3:])
+                except (re.error, ValueError) as e:
+                    raise ValueError(f"bad rule {action} {pattern!r}: {e}") from None
+                regexes.append((action, prepared, pattern))
+            else:
+                term = pattern.lower()
+                # 'block' wins if a term appears under both actions
+                if term_action.get(term) != "block":
+                    term_action[term] = action
+
+        self.index = _LiteralIndex(regexes)
+        self.matchers = [
+            _Matcher(action, [t for t, a in term_action.items() if a == action],
+                     [(p, r) for a, p, r in self.index.unindexed if a == action])
+            for action in ACTIONS
+        ]
+
+    # Most severe (action, rule) found in text, or None
+    def match(self, text: str) -> Optional[Tuple[str, str]]:
+        lowered = text.lower()
+        candidates = self.index.candidates(text, lowered)
+        for matcher in self.matchers:
+            rule = matcher.search(text, lowered, candidates)
+            if rule is not None:
+                return matcher.action, rule
+        return None
+
+def parse_rules(text: str) -> List[Tuple[str, str]]:
+    rules = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        head, _, rest = line.partition(" ")
+        if head.lower() in ACTIONS and rest.strip():
+            rules.append((head.lower(), rest.strip()))
+        else:
+            rules.append(("block", line))
+    return rules
+
+# Message filter stage: drops blocked messages and logs flagged ones.
+# Rules come from a file that is reloaded when it changes on disk.
+class ModerationFilter:
+    FIELDS = ("message",)
+    RELOAD_CHECK_S = 2.0
+
+    def __init__(self, rules_path: Optional[str] = None, rules: Optional[List[Tuple[str, str]]] = None):
+        self.rules_path = rules_path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0.0
+        self._rules = _RuleSet(rules or [])
+        if rules_path:
+            self.reload()
+
+        # Cost metric: messages checked and total time spent checking them
+        self.checked = 0
+        self.total_ns = 0
+        self.last_cost_ns = 0
+
+    # Re-read the rule file; a broken file keeps the previous rules
+    def reload(self) -> bool:
+        try:
+            mtime = os.stat(self.rules_path).st_mtime_ns
+            with open(self.rules_path, encoding="utf-8") as f:
+                rules = _RuleSet(parse_rules(f.read()))
+        except Exception:
+            logging.exception(f"failed to load moderation rules from {self.rules_path}")
+            return False
+        self._rules = rules
+        self._mtime = mtime
+        return True
+
+    # Reload at most every RELOAD_CHECK_S, and only when the file changed
+    def _maybe_reload(self):
+        if not self.rules_path:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.RELOAD_CHECK_S
+            try:
+                mtime = os.stat(self.rules_path).st_mtime_ns
+            except OSError:
+                return
+            if mtime != self._mtime:
+                self.reload()
+
+    def check(self, message) -> ModerationResult:
+        self._maybe_reload()
+        t0 = time.perf_counter_ns()
+        rules = self._rules
+        hit = None
+        for f in self.FIELDS:
+            found = rules.match(getattr(message, f) or "")
+            if found:
+                hit = found
+                if found[0] == "block":
+                    break
+        cost = time.perf_counter_ns() - t0
+        self.checked += 1
+        self.total_ns += cost
+        self.last_cost_ns = cost
+        if hit is None:
+            return ModerationResult(ALLOW, None, cost)
+        return ModerationResult(hit[0], hit[1], cost)
+
+    # Pipeline stage: return the messages that may pass
+    def __call__(self, messages: List) -> List:
+        passed = []
+        for m in messages:
+            result = self.check(m)
+            if result.blocked:
+                logging.warning(f"blocked message from {m.fromUser} (rule {result.rule!r})")
+                continue
+            if result.action == "flag":
+                logging.warning(f"flagged message from {m.fromUser} (rule {result.rule!r})")
+            passed.append(m)
+        return passed
+
+    # Mean time spent per checked message, in microseconds
+    def mean_cost_us(self) -> float:
+        return self.total_ns / self.checked / 1000 if self.checked else 0.0
@@ -0,0 +1,236 @@
+import os
+import re
+import glob
+import mmap
+import heapq
+import argparse
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from history import list_segments, read_segment
+
+# Sharded history for compliance search.
+# Each shard holds one UTC day of messages, one per line, oldest first:
+#   timestamp_ms \t fromUser \t toUser \t toGroup \t message \n
+# with '\\', '\t' and '\n' escaped, so shards can be scanned in place through mmap.
+SHARD_PREFIX = "shard-"
+SHARD_SUFFIX = ".tsv"
+CHUNK_BYTES = 8 << 20  # work unit handed to one process
+
+class ArchivedMessage(NamedTuple):
+    fromUser: str = ""
+    toUser: str = ""
+    toGroup: str = ""
+    message: str = ""
+    timestamp_ms: int = 0
+
+_ESC = {"\\": "\\\\", "\t": "\\t", "\n": "\\n"}
+_UNESC = {"\\": "\\", "t": "\t", "n": "\n"}
+_ESC_RE = re.compile(r"[\\\t\n]")
+_UNESC_RE = re.compile(r"\\(.)")
+
+def _escape(s: str) -> str:
+    return _ESC_RE.sub(lambda m: _ESC[m.group(0)], s or "")
+
+def _unescape(s: str) -> str:
+    return _UNESC_RE.sub(lambda m: _UNESC.get(m.group(1), m.group(1)), s)
+
+def _format_line(m) -> str:
+    return "\t".join((str(m.timestamp_ms), _escape(m.fromUser), _escape(m.toUser),
+                      _escape(m.toGroup), _escape(m.message))) + "\n"
+
+def _parse_line(line: bytes) -> ArchivedMessage:
+    ts, from_user, to_user, to_group, message = line.decode("utf-8").split("\t", 4)
+    return ArchivedMessage(_unescape(from_user), _unescape(to_user), _unescape(to_group),
+                           _unescape(message), int(ts))
+
+def _shard_name(timestamp_ms: int) -> str:
+    day = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc).strftime("%Y%m%d")
+    return f"{SHARD_PREFIX}{day}{SHARD_SUFFIX}"
+
+def _read_shard(path: str) -> List[ArchivedMessage]:
+    with open(path, "rb") as f:
+        return [_parse_line(line.rstrip(b"\n")) for line in f if line.strip()]
+
+# Add messages to the day shards under shard_dir, merging with what is already there.
+# Returns the shard paths that were written.
+def build_shards(messages: Iterable, shard_dir: str) -> List[str]:
+    by_shard = {}
+    for m in messages:
+        row = ArchivedMessage(m.fromUser or "", m.toUser or "", m.toGroup or "", m.message or "", m.timestamp_ms)
+        by_shard.setdefault(_shard_name(row.timestamp_ms), []).append(row)
+
+    os.makedirs(shard_dir, exist_ok=True)
+    written = []
+    for name, rows in sorted(by_shard.items()):
+        path = os.path.join(shard_dir, name)
+        if os.path.exists(path):
+            rows.extend(_read_shard(path))
+        rows = sorted(set(rows), key=lambda r: (r.timestamp_ms, r))
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+            f.writelines(_format_line(r) for r in rows)
+        os.replace(tmp, path)
+        written.append(path)
+    return written
+
+# Build shards from the history archive written by HistoryStore.compact
+def build_shards_from_archive(archive_dir: str, shard_dir: str) -> List[str]:
+    messages = []
+    for p in list_segments(archive_dir):
+        messages.extend(read_segment(p, ArchivedMessage))
+    return build_shards(messages, shard_dir)
+
+# What to look for: every term must appear in one of a message's fields
+# (fromUser, toUser, toGroup, message), and the regex (if any) must match one
+# of them on its own, so ^ and $ anchor to the start and end of a field.
+# Terms are first looked for in the escaped UTF-8 bytes (folding ASCII letters
+# only), then confirmed on the unescaped fields with the regex's case folding.
+class Query:
+    def __init__(self, terms: Iterable[str] = (), regex: Optional[str] = None, ignore_case: bool = True):
+        self.terms = [t for t in terms if t]
+        self.regex = regex
+        self.ignore_case = ignore_case
+        if not self.terms and not self.regex:
+            raise ValueError("query needs at least one term or a regex")
+
+    # Compiled bytes patterns for the terms (the first drives the scan), the
+    # same terms as str patterns to confirm them, and the regex
+    def compile(self) -> Tuple[List["re.Pattern"], List["re.Pattern"], Optional["re.Pattern"]]:
+        flags = re.IGNORECASE if self.ignore_case else 0
+        # Longest terms first: they are usually the rarest
+        terms = sorted(self.terms, key=len, reverse=True)
+        scan = [re.compile(re.escape(_escape(t).encode("utf-8")), flags) for t in terms]
+        confirm = [re.compile(re.escape(t), flags) for t in terms]
+        regex = re.compile(self.regex, flags) if self.regex else None
+        return scan, confirm, regex
+
+# Lines in [start, end) containing a match of `pattern` after the timestamp,
+# as (line start, text start, line end)
+def _candidate_lines(mm, start: int, end: int, pattern) -> Iterator[Tuple[int, int, int]]:
+    pos = start
+    while pos < end:
+        m = pattern.search(mm, pos, end)
+        if m is None:
+            return
+        line_start = mm.rfind(b"\n", start, m.start()) + 1 or start
+        line_end = mm.find(b"\n", m.start(), end)
+        if line_end < 0:
+            line_end = end
+        # Only the message fields count, not the leading timestamp
+        text_start = mm.find(b"\t", line_start, line_end) + 1
+        if m.start() < text_start:
+            pos = text_start
+            continue
+        yield line_start, text_start, line_end
+        pos = line_end + 1
+
+# Every line in [start, end), as (line start, text start, line end)
+def _all_lines(mm, start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+    pos = start
+    while pos < end:
+        line_end = mm.find(b"\n", pos, end)
+        if line_end < 0:
+            line_end = end
+        if line_end > pos:
+            yield pos, mm.find(b"\t", pos, line_end) + 1, line_end
+        pos = line_end + 1
+
+# Worker: scan bytes [start, end) of a shard, line-aligned, without copying the file.
+# Only candidate lines are copied out, parsed and checked field by field, since
+# a term can also match inside an escape sequence (e.g. "t" in "\\t").
+def _search_chunk(path: str, start: int, end: int, query: Query) -> List[ArchivedMessage]:
+    scan, confirm, regex = query.compile()
+    hits = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        lines = _candidate_lines(mm, start, end, scan[0]) if scan else _all_lines(mm, start, end)
+        for line_start, text_start, line_end in lines:
+            if not all(p.search(mm, text_start, line_end) for p in scan[1:]):
+                continue
+            m = _parse_line(mm[line_start:line_end])
+            fields = (m.fromUser, m.toUser, m.toGroup, m.message)
+            if not all(any(p.search(v) for v in fields) for p in confirm):
+                continue
+            if regex is not None and not any(regex.search(v) for v in fields):
+                continue
+            hits.append(m)
+    return hits
+
+# Split shards into line-aligned byte ranges, in timestamp order
+def _plan_chunks(shard_dir: str, chunk_bytes: int) -> List[Tuple[str, int, int]]:
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(shard_dir, f"{SHARD_PREFIX}*{SHARD_SUFFIX}"))):
+        size = os.path.getsize(path)
+        if not size:
+            continue
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            while start < size:
+                end = min(start + chunk_bytes, size)
+                if end < size:
+                    nl = mm.find(b"\n", end)
+                    end = size if nl < 0 else nl + 1
+                chunks.append((path, start, end))
+                start = end
+    return chunks
+
+# Search every shard in parallel and yield matches oldest first, as soon as
+# all earlier chunks are done. Shards are disjoint days, so chunk order is time order.
+def search(shard_dir: str, query: Query, workers: Optional[int] = None,
+           chunk_bytes: int = CHUNK_BYTES) -> Iterator[ArchivedMessage]:
+    chunks = _plan_chunks(shard_dir, chunk_bytes)
+    if not chunks:
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_search_chunk, path, start, end, query): i
+                   for i, (path, start, end) in enumerate(chunks)}
+        done_results = {}
+        next_index = 0
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    done_results[pending.pop(fut)] = fut.result()
+                while next_index in done_results:
+                    yield from done_results.pop(next_index)
+                    next_index += 1
+        finally:
+            for fut in pending:
+                fut.cancel()
+
+# Search several shard directories (e.g. one per client) and merge them by timestamp
+def search_merged(shard_dirs: List[str], query: Query, workers: Optional[int] = None) -> Iterator[ArchivedMessage]:
+    streams = [search(d, query, workers) for d in shard_dirs]
+    return heapq.merge(*streams, key=lambda m: m.timestamp_ms)
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded search over archived chat history")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_build = sub.add_parser("build", help="build day shards from a history archive")
+    p_build.add_argument("archive_dir")
+    p_build.add_argument("shard_dir")
+
+    p_query = sub.add_parser("query", help="search shards")
+    p_query.add_argument("shard_dir")
+    p_query.add_argument("terms", nargs="*", help="all terms must appear")
+    p_query.add_argument("--regex", help="regular expression to match")
+    p_query.add_argument("--case-sensitive", action="store_true")
+    p_query.add_argument("--workers", type=int, default=None)
+    p_query.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        for path in build_shards_from_archive(args.archive_dir, args.shard_dir):
+            print(path)
+        return
+
+    query = Query(args.terms, args.regex, ignore_case=not args.case_sensitive)
+    for count, m in enumerate(search(args.shard_dir, query, args.workers), 1):
+        ts = datetime.fromtimestamp(m.timestamp_ms / 1000).strftime('%Y-%m-%d %H:%M:%S')
+        print(f"[{ts}] {m.fromUser} (to {m.toUser or m.toGroup}): {m.message}", flush=True)
+        if args.limit is not None and count >= args.limit:
+            break
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import time
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+from chat import ChatUser, ChatMessage
+from capture import (KIND_MESSAGES, KIND_USERS_DROPPED, KIND_USERS_JOINED, MAGIC, CapturedSample,
+                     CaptureWriter, read_capture, replay)
+
+def sample(data, valid=True, sec=0, nanosec=0):
+    info = SimpleNamespace(valid=valid, source_timestamp=SimpleNamespace(sec=sec, nanosec=nanosec))
+    return SimpleNamespace(data=data, info=info)
+
+def write_log(path, batches):
+    w = CaptureWriter(str(path))
+    for kind, samples in batches:
+        w.write(kind, samples)
+    w.close()
+
+def test_round_trip_keeps_sample_info(tmp_path):
+    path = tmp_path / "a.cap"
+    alice = ChatUser(username="alice", group="g", firstName="Al", lastName=None)
+    hello = ChatMessage(fromUser="alice", toUser="", toGroup="g", message="héllo\n", timestamp_ms=123)
+    write_log(path, [
+        (KIND_USERS_JOINED, [sample(alice, sec=5, nanosec=7)]),
+        (KIND_MESSAGES, [sample(hello, sec=6), sample(None, valid=False, sec=8)]),
+        (KIND_USERS_DROPPED, []),  # empty batches are not recorded
+    ])
+
+    users, messages = list(read_capture(str(path)))
+    assert users.kind == KIND_USERS_JOINED
+    assert users.entries == [CapturedSample(alice, True, 5_000_000_007)]
+    assert messages.kind == KIND_MESSAGES
+    assert messages.entries == [CapturedSample(hello, True, 6_000_000_000),
+                                CapturedSample(None, False, 8_000_000_000)]
+    assert messages.samples == [hello]
+    assert users.arrival_ns <= messages.arrival_ns
+
+def test_missing_source_timestamp_is_recorded_as_zero(tmp_path):
+    path = tmp_path / "a.cap"
+    write_log(path, [(KIND_MESSAGES, [SimpleNamespace(data=ChatMessage(message="x"), info=SimpleNamespace(valid=True))])])
+    (rec,) = read_capture(str(path))
+    assert rec.entries[0].source_ts_ns == 0
+
+def test_not_a_capture_log(tmp_path):
+    path = tmp_path / "a.cap"
+    path.write_bytes(b"hello world\n")
+    with pytest.raises(ValueError):
+        list(read_capture(str(path)))
+
+@pytest.mark.parametrize("cut", [1, 10, 30])
+def test_truncated_tail_is_ignored(tmp_path, caplog, cut):
+    path = tmp_path / "a.cap"
+    write_log(path, [(KIND_MESSAGES, [sample(ChatMessage(message=f"m{i}"))]) for i in range(3)])
+    data = path.read_bytes()
+    path.write_bytes(data[:-cut])
+    with caplog.at_level(logging.WARNING):
+        records = list(read_capture(str(path)))
+    assert [r.samples[0].message for r in records] == ["m0", "m1"]
+    assert "truncated" in caplog.text
+
+def test_corrupt_record_stops_the_log(tmp_path, caplog):
+    path = tmp_path / "a.cap"
+    write_log(path, [(KIND_MESSAGES, [sample(ChatMessage(message="ok"))])])
+    # A record whose body is shorter than its sample count needs
+    path.write_bytes(path.read_bytes() + bytes([KIND_MESSAGES]) + (0).to_bytes(8, "little")
+                     + (5).to_bytes(4, "little") + (1).to_bytes(4, "little") + b"\x01")
+    with caplog.at_level(logging.WARNING):
+        records = list(read_capture(str(path)))
+    assert len(records) == 1
+    assert "corrupt" in caplog.text
+
+def test_buffer_is_flushed_without_further_writes(tmp_path):
+    path = tmp_path / "a.cap"
+    w = CaptureWriter(str(path), flush_interval_s=0.05)
+    w.write(KIND_MESSAGES, [sample(ChatMessage(message="burst"))])
+    try:
+        for _ in range(100):
+            if path.stat().st_size > len(MAGIC):
+                break
+            time.sleep(0.01)
+        (rec,) = read_capture(str(path))
+        assert rec.samples[0].message == "burst"
+    finally:
+        w.close()
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+
+    def users_joined(self, users):
+        self.calls.append(("joined", [u.username for u in users], time.perf_counter()))
+
+    def users_dropped(self, users):
+        self.calls.append(("dropped", [u.username for u in users], time.perf_counter()))
+
+    def message_received(self, messages):
+        self.calls.append(("message", [m.message for m in messages], time.perf_counter()))
+
+# A log whose batches arrived gap_ns apart
+def spaced_log(path, gap_ns, monkeypatch):
+    now = [1_000_000_000]
+    monkeypatch.setattr(time, "time_ns", lambda: now[0])
+    w = CaptureWriter(str(path))
+    for kind, samples in [
+        (KIND_USERS_JOINED, [sample(ChatUser(username="alice", group="g"))]),
+        (KIND_MESSAGES, [sample(ChatMessage(message="hi")), sample(None, valid=False)]),
+        (KIND_MESSAGES, [sample(None, valid=False)]),  # nothing valid: not dispatched
+        (KIND_USERS_DROPPED, [sample(ChatUser(username="alice", group="g"))]),
+    ]:
+        w.write(kind, samples)
+        now[0] += gap_ns
+    w.close()
+    monkeypatch.undo()
+
+def test_replay_dispatches_valid_samples_in_order(tmp_path, monkeypatch):
+    path = tmp_path / "a.cap"
+    spaced_log(path, 10_000_000_000, monkeypatch)
+    handlers = Recorder()
+    ticks = []
+    assert replay(str(path), handlers, speed=0, tick=lambda: ticks.append(1)) == 4
+    assert [(kind, items) for kind, items, _ in handlers.calls] == [
+        ("joined", ["alice"]), ("message", ["hi"]), ("dropped", ["alice"]),
+    ]
+    assert len(ticks) == 4
+
+def test_replay_keeps_recorded_spacing_scaled_by_speed(tmp_path, monkeypatch):
+    path = tmp_path / "a.cap"
+    spaced_log(path, 100_000_000, monkeypatch)  # 100 ms between batches
+    handlers = Recorder()
+    t0 = time.perf_counter()
+    replay(str(path), handlers, speed=2)
+    elapsed = time.perf_counter() - t0
+    # Three 100 ms gaps at double speed: about 150 ms
+    assert 0.14 <= elapsed < 1.0
+    (_, _, first), (_, _, second), (_, _, last) = handlers.calls
+    assert second - first >= 0.045
+    assert last - first >= 0.14
@@ -0,0 +1,250 @@
+import json
+import asyncio
+
+import pytest
+
+from conftest import msg
+from gateway import (Gateway, MAX_FRAME, OP_PING, OP_PONG, OP_TEXT, _bench_client, _mask,
+                     history_page, ws_accept_key, ws_frame, ws_read)
+
+# ===== Framing =====
+
+def test_accept_key_matches_rfc_example():
+    assert ws_accept_key("dGhlIHNhbXBsZSBub25jZQ==") == "s3pPLMBiTxaQ9kYGzzhZRbK+xOo="
+
+def test_mask_is_its_own_inverse():
+    payload = bytes(range(256)) * 3
+    key = b"\x01\x80\xff\x10"
+    assert _mask(payload, key) != payload
+    assert _mask(_mask(payload, key), key) == payload
+    assert _mask(b"", key) == b""
+
+async def _read_frames(data: bytes, max_size: int = MAX_FRAME):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return await ws_read(reader, max_size)
+
+@pytest.mark.parametrize("size", [0, 125, 126, 65535, 65536])
+@pytest.mark.parametrize("mask", [False, True])
+def test_frame_round_trip(size, mask):
+    payload = bytes(i % 251 for i in range(size))
+    assert asyncio.run(_read_frames(ws_frame(OP_TEXT, payload, mask), 1 << 20)) == (OP_TEXT, payload)
+
+def test_continuation_frames_are_joined():
+    first = bytes([0x00 | OP_TEXT, 3]) + b"abc"  # FIN not set
+    last = bytes([0x80, 2]) + b"de"              # continuation, FIN
+    assert asyncio.run(_read_frames(first + last)) == (OP_TEXT, b"abcde")
+
+def test_oversized_message_is_rejected():
+    with pytest.raises(ValueError):
+        asyncio.run(_read_frames(ws_frame(OP_TEXT, b"x" * 11), max_size=10))
+
+# ===== History paging =====
+
+def test_history_pages_never_skip_messages_sharing_a_timestamp():
+    items = [msg(f"m{i}", ts) for i, ts in enumerate([1, 2, 2, 2, 2, 3, 4])]
+    seen, before, skip = [], None, 0
+    while True:
+        page = history_page(items, before, limit=2, skip=skip)
+        if not page:
+            break
+        seen = [m.message for m in page] + seen
+        oldest = page[0].timestamp_ms
+        skip = sum(1 for m in page if m.timestamp_ms == oldest) + (skip if oldest == before else 0)
+        before = oldest
+    assert seen == [m.message for m in items]
+
+# ===== Gateway against localhost clients, with a stub DDS bus =====
+
+class StubBus:
+    def __init__(self):
+        self.refs = {}
+        self.joined = []
+        self.left = []
+        self.sent = []
+        self.history_items = []
+        self.fail_join = False
+        self.fail_send = False
+
+    def attach(self, loop, gateway):
+        self.loop = loop
+        self.gateway = gateway
+
+    def subscribe(self, group):
+        self.refs[group] = self.refs.get(group, 0) + 1
+
+    def unsubscribe(self, group):
+        self.refs[group] -= 1
+        if not self.refs[group]:
+            del self.refs[group]
+
+    def user_join(self, user):
+        if self.fail_join:
+            raise ValueError("string too long")
+        self.joined.append(user.username)
+
+    def user_leave(self, user):
+        self.left.append(user.username)
+
+    def user_list(self):
+        return []
+
+    def message_send(self, user, destination, text):
+        if self.fail_send:
+            raise RuntimeError("write failed")
+        self.sent.append((user.username, destination, text))
+        return text != "spam"
+
+    def history(self, group, before=None, limit=50, skip=0):
+        return history_page([m for m in self.history_items if m.toGroup == group], before, limit, skip)
+
+    def close(self):
+        pass
+
+async def _http_get(port, target):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode("latin-1"))
+    data = await reader.read()
+    writer.close()
+    head, _, body = data.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body) if body else None
+
+async def _recv(reader, timeout=2.0):
+    opcode, payload = await asyncio.wait_for(ws_read(reader, 1 << 20), timeout)
+    return json.loads(payload) if opcode == OP_TEXT else (opcode, payload)
+
+async def _send(writer, body: dict):
+    writer.write(ws_frame(OP_TEXT, json.dumps(body).encode("utf-8"), mask=True))
+    await writer.drain()
+
+async def _wait_for(predicate, timeout=2.0):
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not met")
+
+def run_gateway(test):
+    async def main():
+        bus = StubBus()
+        gw = Gateway(bus, port=0)
+        await gw.start()
+        try:
+            await test(gw, bus)
+        finally:
+            await gw.stop()
+    asyncio.run(main())
+
+def test_connection_counts_follow_sockets():
+    async def test(gw, bus):
+        clients = [await _bench_client("127.0.0.1", gw.port, u, g)
+                   for u, g in (("alice", "g1"), ("bob", "g1"), ("carol", "g2"))]
+        assert gw.connection_count == 3
+        assert bus.refs == {"g1": 2, "g2": 1}
+        assert sorted(bus.joined) == ["alice", "bob", "carol"]
+
+        clients[0][1].close()
+        await _wait_for(lambda: gw.connection_count == 2)
+        assert bus.left == ["alice"]
+        clients[2][1].close()
+        await _wait_for(lambda: gw.connection_count == 1)
+        assert bus.refs == {"g1": 1}
+        assert (await _http_get(gw.port, "/stats"))[1]["groups"] == {"g1": 1}
+    run_gateway(test)
+
+def test_group_messages_fan_out_to_the_group_only():
+    async def test(gw, bus):
+        clients = [await _bench_client("127.0.0.1", gw.port, u, g)
+                   for u, g in (("alice", "g1"), ("bob", "g1"), ("carol", "g2"))]
+        (ra, _), (rb, _), (rc, _) = clients
+        gw.on_messages("g1", [msg("hello", 1, "alice", to_group="g1")])
+        for r in (ra, rb):
+            assert (await _recv(r))["message"] == "hello"
+        with pytest.raises(asyncio.TimeoutError):
+            await _recv(rc, timeout=0.2)
+        assert gw.stats.sends == 2
+    run_gateway(test)
+
+def test_private_messages_reach_only_sender_and_recipient():
+    async def test(gw, bus):
+        clients = [await _bench_client("127.0.0.1", gw.port, u, "g1") for u in ("alice", "bob", "carol")]
+        (ra, _), (rb, _), (rc, _) = clients
+        gw.on_messages("g1", [msg("psst", 1, "alice", to_user="bob", to_group="")])
+        for r in (ra, rb):
+            assert (await _recv(r))["message"] == "psst"
+        with pytest.raises(asyncio.TimeoutError):
+            await _recv(rc, timeout=0.2)
+    run_gateway(test)
+
+def test_client_messages_are_checked_and_errors_reported():
+    async def test(gw, bus):
+        reader, writer = await _bench_client("127.0.0.1", gw.port, "alice", "g1")
+        await _send(writer, {"to": "g1", "message": "hi"})
+        await _wait_for(lambda: bus.sent == [("alice", "g1", "hi")])
+
+        await _send(writer, {"to": "g1", "message": "spam"})
+        assert (await _recv(reader))["error"] == "message blocked"
+        await _send(writer, {"to": "g1", "message": "x" * 513})
+        assert (await _recv(reader))["error"] == "message too long"
+        await _send(writer, {"message": "no destination"})
+        assert (await _recv(reader))["error"] == "bad message"
+        bus.fail_send = True
+        await _send(writer, {"to": "g1", "message": "hi"})
+        assert (await _recv(reader))["error"] == "send failed"
+
+        # The socket survives all of the above
+        writer.write(ws_frame(OP_PING, b"p", mask=True))
+        assert await _recv(reader) == (OP_PONG, b"p")
+        assert gw.connection_count == 1
+    run_gateway(test)
+
+def test_websocket_parameters_are_validated():
+    async def test(gw, bus):
+        with pytest.raises(ConnectionError, match="400"):
+            await _bench_client("127.0.0.1", gw.port, "u" * 129, "g1")
+        with pytest.raises(ConnectionError, match="400"):
+            await _bench_client("127.0.0.1", gw.port, "alice", "g" * 129)
+        assert gw.connection_count == 0
+        assert bus.refs == {}
+    run_gateway(test)
+
+def test_failed_join_does_not_leave_the_socket_registered():
+    async def test(gw, bus):
+        bus.fail_join = True
+        reader, _ = await _bench_client("127.0.0.1", gw.port, "alice", "g1")
+        assert await asyncio.wait_for(reader.read(), 2) == b""  # closed by the gateway
+        assert gw.connection_count == 0
+        assert gw.by_user == {}
+        assert bus.refs == {}
+    run_gateway(test)
+
+def test_history_parameters_and_paging():
+    async def test(gw, bus):
+        bus.history_items = [msg(f"m{i}", ts) for i, ts in enumerate([1, 2, 2, 2, 3])]
+        bus.history_items.append(msg("other", 2, to_group="h"))
+
+        assert (await _http_get(gw.port, "/history"))[0] == 400
+        assert (await _http_get(gw.port, "/history?group=g&before=x"))[0] == 400
+        assert (await _http_get(gw.port, "/history?group=g&user=bob"))[0] == 200
+        status, body = await _http_get(gw.port, "/history?group=g&limit=0")
+        assert (status, [m["message"] for m in body["messages"]]) == (200, ["m4"])
+
+        seen, query = [], "/history?group=g&limit=2"
+        while True:
+            status, body = await _http_get(gw.port, query)
+            if not body["messages"]:
+                break
+            seen = [m["message"] for m in body["messages"]] + seen
+            query = f"/history?group=g&limit=2&before={body['next_before']}&skip={body['next_skip']}"
+        assert seen == ["m0", "m1", "m2", "m3", "m4"]
+    run_gateway(test)
+
+def test_oversized_request_head_gets_431():
+    async def test(gw, bus):
+        reader, writer = await asyncio.open_connection("127.0.0.1", gw.port)
+        writer.write(b"GET /stats HTTP/1.1\r\nX-Big: " + b"a" * (Gateway.MAX_HEADER + 10) + b"\r\n\r\n")
+        data = await asyncio.wait_for(reader.read(), 2)
+        writer.close()
+        assert data.startswith(b"HTTP/1.1 431")
+    run_gateway(test)
@@ -0,0 +1,142 @@
+import os
+from types import SimpleNamespace
+
+from conftest import msg
+from history import HistoryStore, RetentionPolicy, conversation_key, list_segments
+
+NOW = 1_700_000_000_000
+
+def texts(messages):
+    return [m.message for m in messages]
+
+def test_conversation_key_is_symmetric_for_private_messages():
+    assert conversation_key(msg("x", 0, "a", "b", "")) == conversation_key(msg("x", 0, "b", "a", ""))
+    assert conversation_key(msg("x", 0, to_group="g")) == "#g"
+
+def test_split_by_age():
+    policy = RetentionPolicy(max_age_s=10, max_count=None, max_per_conversation=None)
+    messages = [msg("old", NOW - 20_000), msg("edge", NOW - 10_000), msg("new", NOW)]
+    kept, expired = policy.split(messages, NOW)
+    assert texts(kept) == ["edge", "new"]
+    assert texts(expired) == ["old"]
+
+def test_split_keeps_newest_per_conversation_then_count():
+    policy = RetentionPolicy(max_age_s=None, max_count=3, max_per_conversation=2)
+    messages = [
+        msg("g1", 1), msg("d1", 2, "a", "b", ""), msg("g2", 3),
+        msg("d2", 4, "b", "a", ""), msg("g3", 5), msg("d3", 6, "a", "b", ""),
+    ]
+    kept, expired = policy.split(messages, NOW)
+    # Quota leaves g2, g3, d2, d3; the count limit then drops the oldest of those
+    assert texts(kept) == ["d2", "g3", "d3"]
+    assert texts(expired) == ["g1", "d1", "g2"]
+
+def test_split_without_limits_keeps_everything():
+    policy = RetentionPolicy(max_age_s=None, max_count=None, max_per_conversation=None)
+    messages = [msg(str(i), i) for i in range(5)]
+    assert policy.split(messages, NOW) == (messages, [])
+
+def test_add_keeps_time_order():
+    store = HistoryStore()
+    store.add([msg("b", 2), msg("c", 3)])
+    store.add([msg("a", 1)])
+    assert texts(store.all()) == ["a", "b", "c"]
+    assert texts(store.all(limit=2)) == ["b", "c"]
+
+def test_search_is_case_insensitive_on_all_fields():
+    store = HistoryStore()
+    store.add([msg("Hello", 1), msg("bye", 2, from_user="HELLOKITTY"), msg("nope", 3)])
+    assert texts(store.search("hello")) == ["Hello", "bye"]
+
+def test_compact_and_import_round_trip(tmp_path):
+    policy = RetentionPolicy(max_age_s=10, max_count=None, max_per_conversation=None)
+    store = HistoryStore(policy)
+    store.add([msg("m0", NOW - 30_000), msg("tab\there", NOW - 20_000), msg("m2", NOW)])
+    path = store.compact(str(tmp_path), prefix="alice", now_ms=NOW)
+    assert os.path.basename(path).startswith("alice-")
+    assert texts(store.all()) == ["m2"]
+
+    restored = HistoryStore(factory=SimpleNamespace)
+    assert restored.import_archive(str(tmp_path), prefix="alice") == 2
+    assert texts(restored.all()) == ["m0", "tab\there"]
+
+def test_compact_does_not_archive_replayed_history_twice(tmp_path):
+    policy = RetentionPolicy(max_age_s=10, max_count=None, max_per_conversation=None)
+    old = [msg(f"m{i}", NOW - 100_000 + i) for i in range(3)]
+
+    first = HistoryStore(policy)
+    first.add(old)
+    assert first.compact(str(tmp_path), "alice", now_ms=NOW)
+
+    # After a restart the same messages are replayed, plus two newer ones
+    second = HistoryStore(policy)
+    second.add(old + [msg("m3", NOW - 50_000), msg("m4", NOW - 40_000)])
+    path = second.compact(str(tmp_path), "alice", now_ms=NOW + 2_000)
+    assert path.endswith("-2.jsonl.gz")
+
+    restored = HistoryStore(factory=SimpleNamespace)
+    assert restored.import_archive(str(tmp_path), prefix="alice") == 5
+    assert texts(restored.all()) == ["m0", "m1", "m2", "m3", "m4"]
+
+def test_compact_archives_messages_older_than_earlier_segments(tmp_path):
+    # The per-conversation quota can expire a message older than one already archived
+    policy = RetentionPolicy(max_age_s=None, max_count=None, max_per_conversation=1)
+    store = HistoryStore(policy)
+    store.add([msg("y-old", 500, to_group="y"), msg("x0", 800, to_group="x"), msg("x1", 900, to_group="x")])
+    assert store.compact(str(tmp_path), "u", now_ms=NOW)
+    assert texts(store.all()) == ["y-old", "x1"]
+
+    store.add([msg("y-new", 1500, to_group="y")])
+    assert store.compact(str(tmp_path), "u", now_ms=NOW)
+    assert texts(store.all()) == ["x1", "y-new"]
+
+    restored = HistoryStore(factory=SimpleNamespace)
+    restored.import_archive(str(tmp_path), prefix="u")
+    assert texts(restored.all()) == ["y-old", "x0"]
+
+def test_import_skips_duplicates_across_segments_and_calls(tmp_path):
+    policy = RetentionPolicy(max_age_s=0, max_count=None, max_per_conversation=None)
+    for prefix in ("a1", "a2"):
+        store = HistoryStore(policy)
+        store.add([msg("same", NOW - 1)])
+        store.compact(str(tmp_path), prefix, now_ms=NOW)
+
+    restored = HistoryStore(factory=SimpleNamespace)
+    assert restored.import_archive(str(tmp_path)) == 1
+    assert restored.import_archive(str(tmp_path)) == 0
+    assert len(restored) == 1
+
+def test_prefix_matches_whole_username(tmp_path):
+    policy = RetentionPolicy(max_age_s=0, max_count=None, max_per_conversation=None)
+    for prefix in ("al", "alice", "al-x"):
+        store = HistoryStore(policy)
+        store.add([msg(prefix, NOW - 1)])
+        store.compact(str(tmp_path), prefix, now_ms=NOW)
+
+    assert len(list_segments(str(tmp_path))) == 3
+    assert len(list_segments(str(tmp_path), "al")) == 1
+    restored = HistoryStore(factory=SimpleNamespace)
+    restored.import_archive(str(tmp_path), prefix="al")
+    assert texts(restored.all()) == ["al"]
+
+def test_search_and_all_include_archived_history(tmp_path):
+    policy = RetentionPolicy(max_age_s=10, max_count=None, max_per_conversation=None)
+    store = HistoryStore(policy, factory=SimpleNamespace)
+    store.add([msg("old hello", NOW - 20_000), msg("new hello", NOW)])
+    store.compact(str(tmp_path), "u", now_ms=NOW)
+    assert texts(store.search("hello")) == ["new hello"]
+    assert texts(store.search("hello", archive_dir=str(tmp_path), prefix="u")) == ["old hello", "new hello"]
+    assert texts(store.all(limit=1, archive_dir=str(tmp_path), prefix="u")) == ["new hello"]
+
+    # Replayed again before the next compaction: listed once
+    store.add([msg("old hello", NOW - 20_000)])
+    assert texts(store.all(archive_dir=str(tmp_path), prefix="u")) == ["old hello", "new hello"]
+
+def test_restored_history_is_never_compacted(tmp_path):
+    policy = RetentionPolicy(max_age_s=0, max_count=None, max_per_conversation=None)
+    store = HistoryStore(policy, factory=SimpleNamespace)
+    store.add([msg("old", NOW - 1)])
+    store.compact(str(tmp_path), "u", now_ms=NOW)
+    store.import_archive(str(tmp_path), prefix="u")
+    assert store.compact(str(tmp_path), "u", now_ms=NOW + 1) is None
+    assert texts(store.all()) == ["old"]
@@ -0,0 +1,92 @@
+import pytest
+
+from conftest import msg
+from search import ArchivedMessage, Query, _plan_chunks, _search_chunk, build_shards, search
+
+DAY_MS = 24 * 3600 * 1000
+BASE = 1_700_006_400_000  # midnight UTC
+
+def run(shard_dir, query, chunk_bytes=1 << 20):
+    return [m.message for m in search(shard_dir, query, workers=2, chunk_bytes=chunk_bytes)]
+
+@pytest.fixture
+def shards(tmp_path):
+    messages = [
+        msg("invoice paid", BASE + 1),
+        msg("invoice paid late", BASE + 2),
+        msg("nothing here", BASE + 3),
+        msg("tab\there and line\nbreak", BASE + 4),
+        msg("back\\slash", BASE + 5),
+        msg("invoice paid", BASE + DAY_MS + 1, from_user="bob"),
+        msg("Invoice PAID", BASE + 2 * DAY_MS + 1),
+    ]
+    shard_dir = str(tmp_path / "shards")
+    build_shards(messages, shard_dir)
+    return shard_dir
+
+def test_build_shards_splits_by_day_and_merges_without_duplicates(tmp_path):
+    shard_dir = str(tmp_path)
+    assert len(build_shards([msg("a", BASE), msg("b", BASE + DAY_MS)], shard_dir)) == 2
+    build_shards([msg("a", BASE), msg("c", BASE + 10)], shard_dir)
+    assert run(shard_dir, Query(regex=".")) == ["a", "c", "b"]
+
+def test_results_are_time_ordered_across_shards(shards):
+    assert run(shards, Query(["invoice"])) == [
+        "invoice paid", "invoice paid late", "invoice paid", "Invoice PAID",
+    ]
+
+def test_all_terms_must_match(shards):
+    assert run(shards, Query(["paid", "late"])) == ["invoice paid late"]
+    assert run(shards, Query(["paid", "bob"])) == ["invoice paid"]
+
+def test_case_sensitive_terms(shards):
+    assert run(shards, Query(["PAID"], ignore_case=False)) == ["Invoice PAID"]
+
+def test_regex_anchors_apply_per_field(shards):
+    assert run(shards, Query(regex="paid$")) == ["invoice paid", "invoice paid", "Invoice PAID"]
+    assert run(shards, Query(regex="^invoice paid$", ignore_case=False)) == ["invoice paid", "invoice paid"]
+    assert run(shards, Query(regex="^bob$")) == ["invoice paid"]
+
+def test_regex_does_not_run_across_lines(shards):
+    assert run(shards, Query(regex="paid[^x]*nothing")) == []
+
+def test_regex_combined_with_terms(shards):
+    assert run(shards, Query(["invoice"], regex="late$")) == ["invoice paid late"]
+
+def test_escaped_characters_round_trip_and_match(shards):
+    assert run(shards, Query(["tab\there"])) == ["tab\there and line\nbreak"]
+    assert run(shards, Query(regex="line\nbreak")) == ["tab\there and line\nbreak"]
+    assert run(shards, Query(["back\\slash"])) == ["back\\slash"]
+
+def test_terms_do_not_match_escape_sequences(tmp_path):
+    shard_dir = str(tmp_path)
+    build_shards([msg("hi\tyo\nok", BASE, from_user="u", to_group="x")], shard_dir)
+    assert run(shard_dir, Query(["t"])) == []
+    assert run(shard_dir, Query(["n"])) == []
+    assert run(shard_dir, Query(["\\"])) == []
+    assert run(shard_dir, Query(["yo", "t"])) == []
+    assert run(shard_dir, Query(["\t"])) == ["hi\tyo\nok"]
+    assert run(shard_dir, Query(["OK"])) == ["hi\tyo\nok"]
+
+def test_terms_do_not_match_the_timestamp(shards):
+    assert run(shards, Query([str(BASE + 1)[:6]])) == []
+
+@pytest.mark.parametrize("chunk_bytes", [1, 16, 50, 1 << 20])
+def test_chunk_boundaries_do_not_change_results(shards, chunk_bytes):
+    chunks = _plan_chunks(shards, chunk_bytes)
+    for path, start, end in chunks:
+        with open(path, "rb") as f:
+            data = f.read()
+        assert start == 0 or data[start - 1:start] == b"\n"
+        assert end == len(data) or data[end - 1:end] == b"\n"
+    assert run(shards, Query(["paid"]), chunk_bytes) == run(shards, Query(["paid"]))
+    assert run(shards, Query(regex="paid$"), chunk_bytes) == run(shards, Query(regex="paid$"))
+
+def test_search_chunk_returns_archived_messages(shards):
+    path, start, end = _plan_chunks(shards, 1 << 20)[0]
+    hits = _search_chunk(path, start, end, Query(["late"]))
+    assert hits == [ArchivedMessage("a", "", "g", "invoice paid late", BASE + 2)]
+
+def test_query_needs_terms_or_regex():
+    with pytest.raises(ValueError):
+        Query([])